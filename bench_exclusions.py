@@ -0,0 +1,74 @@
+import os
+import random
+import tempfile
+import time
+
+import main
+from models import Grade, Course
+
+# Benchmark : coût de calculate_semester_stats quand un utilisateur accumule des personnalisations
+# (exclusions de notes + notes manuelles), index par matière vs parcours linéaire d'origine.
+# Utilise une base SQLite temporaire (ne touche pas à notes.db) pour le cache de correspondances.
+
+SIZES = [100, 1_000, 5_000, 10_000]
+GRADES_PER_COURSE = 20
+RUNS = 5
+SEMESTER, OPTION, STATUS = "S3", "EMS", "FI"
+
+def legacy_is_excluded(course_canonical_name, grade_name, grade_value, exclusions_rows):
+    """Version d'origine : parcours de toutes les exclusions pour chaque note"""
+    for ex in exclusions_rows:
+        if ex['course_canonical_name'] == course_canonical_name and ex['grade_name'] == grade_name and abs(ex['grade_value'] - grade_value) < 0.01:
+            return True
+    return False
+
+def make_data(canonical_names, n_overrides):
+    """Matières scrapées (une par nom canonique) + n_overrides exclusions et autant de notes manuelles"""
+    courses = []
+    for k, name in enumerate(canonical_names):
+        grades = [Grade(f"Note {g}", round(random.uniform(0, 20), 2), 20.0) for g in range(GRADES_PER_COURSE)]
+        courses.append(Course(str(1000 + k), name, grades=grades))
+
+    exclusions = []
+    for _ in range(n_overrides):
+        course = random.choice(courses)
+        g = random.choice(course.grades)
+        exclusions.append({"course_canonical_name": course.name, "grade_name": g.name, "grade_value": g.grade})
+
+    manual_grades = [{"id": i, "course_canonical_name": random.choice(canonical_names), "name": f"Manuelle {i}",
+                      "grade": 12.0, "max_grade": 20.0, "coef": 1.0} for i in range(n_overrides)]
+    return courses, manual_grades, exclusions
+
+def run():
+    main.DATABASE_URL = None
+    main.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_exclusions.db")
+    main.init_db()
+    main.maquette_service = main.MaquetteService() # Normalement créé par le lifespan de l'app
+    canonical_names = list(main.maquette_service.load_maquette(SEMESTER, OPTION, STATUS)['courses'])
+
+    indexed_is_excluded = main.is_excluded
+    print(f"{'overrides':>10} | {'linéaire (ms)':>14} | {'indexé (ms)':>12} | {'indexé µs/override':>19}")
+    print("-" * 66)
+    for size in SIZES:
+        courses, manual_grades, exclusions = make_data(canonical_names, size)
+
+        # Avant : listes brutes, filtrage des notes manuelles et des exclusions à chaque matière / note
+        main.is_excluded = legacy_is_excluded
+        start = time.perf_counter()
+        for _ in range(RUNS):
+            main.calculate_semester_stats(courses, {name: [mg for mg in manual_grades if mg['course_canonical_name'] == name] for name in canonical_names},
+                                          {}, {}, exclusions, SEMESTER, OPTION, STATUS)
+        linear = (time.perf_counter() - start) / RUNS * 1000
+
+        # Après : index construits une fois (comme load_user_data), puis recherches O(1)
+        main.is_excluded = indexed_is_excluded
+        start = time.perf_counter()
+        for _ in range(RUNS):
+            main.calculate_semester_stats(courses, main.group_manual_grades(manual_grades), {}, {},
+                                          main.index_exclusions(exclusions), SEMESTER, OPTION, STATUS)
+        indexed = (time.perf_counter() - start) / RUNS * 1000
+
+        print(f"{size:>10} | {linear:>14.2f} | {indexed:>12.2f} | {indexed / size * 1000:>19.2f}")
+
+if __name__ == "__main__":
+    run()
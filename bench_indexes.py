@@ -0,0 +1,69 @@
+import os
+import random
+import tempfile
+import time
+
+import main
+
+# Benchmark : temps de chargement du tableau de bord d'un utilisateur (load_user_data)
+# quand la table grades grossit, avec et sans les index créés par init_db.
+# Utilise une base SQLite temporaire (ne touche pas à notes.db).
+
+SIZES = [1_000, 10_000, 100_000, 250_000]
+GRADES_PER_USER = 200
+COURSES_PER_USER = 25
+RUNS = 20
+
+def fill(conn, total_grades):
+    """Remplit la base avec des utilisateurs de GRADES_PER_USER notes chacun"""
+    c = conn.cursor()
+    n_users = max(1, total_grades // GRADES_PER_USER)
+    course_rows, grade_rows = [], []
+    for u in range(n_users):
+        username = f"user{u}"
+        for k in range(COURSES_PER_USER):
+            course_rows.append((str(1000 + k), username, f"S3 Matière {k}", None, None))
+        for g in range(GRADES_PER_USER):
+            grade_rows.append((str(1000 + g % COURSES_PER_USER), username, f"Note {g}", random.uniform(0, 20), 20.0, False))
+    conn.bulk_insert("courses", ("id", "username", "name", "average", "grades_hash"), course_rows)
+    conn.bulk_insert("grades", ("course_id", "username", "name", "grade", "max_grade", "is_total"), grade_rows)
+    conn.commit()
+    return n_users
+
+def time_load(conn, n_users):
+    c = conn.cursor()
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        main.load_user_data(c, f"user{random.randrange(n_users)}")
+    return (time.perf_counter() - start) / RUNS * 1000
+
+def set_indexes(conn, enabled):
+    c = conn.cursor()
+    for name, ddl in main.DB_INDEXES.items():
+        if enabled:
+            c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {ddl}")
+        else:
+            c.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+
+def run():
+    tmp_dir = tempfile.mkdtemp()
+    main.DATABASE_URL = None
+    print(f"{'notes':>10} | {'sans index (ms)':>16} | {'avec index (ms)':>16}")
+    print("-" * 50)
+    for size in SIZES:
+        main.DB_FILE = os.path.join(tmp_dir, f"bench_{size}.db")
+        main.init_db()
+        conn = main.get_db_connection()
+        n_users = fill(conn, size)
+
+        set_indexes(conn, False)
+        without = time_load(conn, n_users)
+        set_indexes(conn, True)
+        with_idx = time_load(conn, n_users)
+        conn.close()
+
+        print(f"{size:>10} | {without:>16.2f} | {with_idx:>16.2f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,82 @@
+import os
+import random
+import tempfile
+import tracemalloc
+
+import main
+
+# Benchmark : empreinte mémoire par utilisateur des données chargées pour le calcul des moyennes,
+# copies dict par ligne (ancienne représentation) vs enregistrements __slots__ (models.Grade / Course),
+# puis pic mémoire du calcul S3 + S4 + année.
+# Utilise une base SQLite temporaire (ne touche pas à notes.db).
+
+PROFILES = [(25, 10), (25, 40), (60, 100)] # (matières, notes par matière)
+OPTION, STATUS = "EMS", "FI"
+
+def fill(conn, username, n_courses, grades_per_course, canonical_names):
+    course_rows, grade_rows = [], []
+    for k in range(n_courses):
+        name = f"S3 {canonical_names[k % len(canonical_names)]}"
+        course_rows.append((str(1000 + k), username, name, None, None))
+        for g in range(grades_per_course):
+            grade_rows.append((str(1000 + k), username, f"Note {g}", round(random.uniform(0, 20), 2), 20.0, False))
+    conn.bulk_insert("courses", ("id", "username", "name", "average", "grades_hash"), course_rows)
+    conn.bulk_insert("grades", ("course_id", "username", "name", "grade", "max_grade", "is_total"), grade_rows)
+    conn.commit()
+
+def load_as_dicts(c, username):
+    """Ancienne représentation : une copie dict par ligne de notes et de matières"""
+    grades_by_course = {}
+    for g in c.execute("SELECT * FROM grades WHERE username = ?", (username,)).fetchall():
+        g_dict = dict(g)
+        grades_by_course.setdefault(g_dict['course_id'], []).append(g_dict)
+    courses_list = []
+    for r in c.execute("SELECT * FROM courses WHERE username = ?", (username,)).fetchall():
+        c_dict = dict(r)
+        c_dict['grades'] = grades_by_course.get(c_dict['id'], [])
+        courses_list.append(c_dict)
+    return courses_list
+
+def retained(build):
+    """(objet construit, octets encore alloués après construction)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+def peak(run):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    run()
+    top = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return top - base
+
+def run():
+    main.DATABASE_URL = None
+    main.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_memory.db")
+    main.init_db()
+    main.maquette_service = main.MaquetteService() # Normalement créé par le lifespan de l'app
+    canonical_names = list(main.maquette_service.load_maquette("S3", OPTION, STATUS)['courses'])
+
+    print(f"{'notes':>7} | {'dicts (Ko)':>11} | {'__slots__ (Ko)':>15} | {'gain':>6} | {'pic calcul année (Ko)':>22}")
+    print("-" * 74)
+    for u, (n_courses, per_course) in enumerate(PROFILES):
+        username = f"user{u}"
+        with main.get_db_connection() as conn:
+            c = conn.cursor()
+            fill(conn, username, n_courses, per_course, canonical_names)
+            _, as_dicts = retained(lambda: load_as_dicts(c, username))
+            user_data, as_records = retained(lambda: main.load_user_data(c, username))
+        # Connexion rendue : le calcul emprunte la sienne pour match_cache
+        main.year_stats_for(user_data, OPTION, STATUS) # Matchers et match_cache déjà chauds
+        year_peak = peak(lambda: main.year_stats_for(user_data, OPTION, STATUS))
+
+        n_grades = n_courses * per_course
+        print(f"{n_grades:>7} | {as_dicts / 1024:>11.1f} | {as_records / 1024:>15.1f} | {as_dicts / as_records:>5.1f}x | {year_peak / 1024:>22.1f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,382 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+
+# 1. Overrides Manuels : table d'alias partagée avec les scripts de diagnostic
+ALIASES_FILE = "aliases.json"
+
+# Même logique que MAQUETTE_CHECK_INTERVAL (réglable séparément) : délai avant de revérifier le mtime du fichier d'alias
+ALIASES_CHECK_INTERVAL = float(os.getenv("ALIASES_CHECK_INTERVAL", "30"))
+
+class AliasAutomaton:
+    """Automate Aho-Corasick : trouve toutes les occurrences de tous les alias en un seul passage"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]    # état -> { caractère: état suivant }
+        self.fail = [0]     # état -> état de repli
+        self.output = [[]]  # état -> [index des alias reconnus en arrivant ici]
+        for idx, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(idx)
+
+        # Liens de repli calculés en largeur (BFS)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def find_all(self, text):
+        """Liste des (position de fin, index d'alias) trouvés dans text"""
+        hits = []
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for idx in self.output[state]:
+                hits.append((pos, idx))
+        return hits
+
+class AliasTable:
+    """Alias compilés : résolution des conflits par priorité déclarée (puis alias le plus long, puis position)"""
+
+    def __init__(self, entries, digest=""):
+        self.digest = digest # Empreinte du fichier source (sert à invalider les caches de correspondance)
+        self.entries = [(e['alias'].lower(), e['target'], e.get('priority', 0)) for e in entries]
+        self.automaton = AliasAutomaton([alias for alias, _, _ in self.entries])
+
+    def lookup(self, clean_name):
+        """Cible de l'alias gagnant dans clean_name (déjà en minuscules), ou None"""
+        best = None
+        for end, idx in self.automaton.find_all(clean_name):
+            alias, target, priority = self.entries[idx]
+            rank = (priority, len(alias), -(end - len(alias) + 1))
+            if best is None or rank > best[0]:
+                best = (rank, target)
+        return best[1] if best else None
+
+_aliases_cache = {"table": None, "mtime": None, "checked_at": 0.0}
+
+def load_aliases(path=ALIASES_FILE):
+    """Table d'alias du fichier JSON (rechargée si le fichier change)"""
+    now = time.monotonic()
+    cache = _aliases_cache
+    if cache["table"] is not None and cache.get("path") == path and now - cache["checked_at"] < ALIASES_CHECK_INTERVAL:
+        return cache["table"]
+
+    mtime = os.path.getmtime(path)
+    if cache["table"] is None or cache.get("path") != path or cache["mtime"] != mtime:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        entries = json.loads(raw.decode('utf-8'))["aliases"]
+        cache.update(table=AliasTable(entries, hashlib.sha1(raw).hexdigest()), mtime=mtime, path=path)
+    cache["checked_at"] = now
+    return cache["table"]
+
+# Mots vides à ignorer
+STOPWORDS = frozenset(["de", "des", "le", "la", "les", "un", "une", "et", "à", "pour", "en", "d'", "l'", "s3", "s4", "but", "but2", "cours", "td", "tp"])
+
+# Seuil minimum de pertinence pour la correspondance par mots-clés
+MIN_KEYWORD_SCORE = 2
+
+# Confiance attribuée aux règles déterministes (mots-clés et fuzzy ont un score mesuré)
+ALIAS_CONFIDENCE = 1.0
+TEACHER_CONFIDENCE = 0.9
+
+# Décision : (nom canonique, règle appliquée, confiance) ; règle parmi "alias", "teacher", "keyword", "fuzzy"
+NO_MATCH = (None, None, 0.0)
+
+def keywords_of(text):
+    """Mots significatifs d'un nom (en minuscules, > 2 lettres, hors mots vides)"""
+    return [w for w in re.split(r'\W+', text) if len(w) > 2 and w not in STOPWORDS]
+
+# Décisions gardées en mémoire par matcher (LRU) ; au-delà, relues depuis match_cache
+MATCH_CACHE_MAX_ENTRIES = int(os.getenv("MATCH_CACHE_MAX_ENTRIES", "4096"))
+
+# 4. Fuzzy : similarité cosinus minimale (trigrammes TF-IDF) pour accepter une correspondance
+FUZZY_CUTOFF = float(os.getenv("MATCH_FUZZY_CUTOFF", "0.35"))
+
+def fold(text):
+    """Minuscules sans accents ni ponctuation : « Systèmes d’information » -> « systemes d information »"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.split(r'[\W_]+', text)).strip()
+
+def trigrams_of(text):
+    """Occurrences des trigrammes de caractères d'un nom (chaque mot est bordé d'espaces)"""
+    counts = {}
+    for word in fold(text).split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            gram = padded[i:i + 3]
+            counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+class TrigramIndex:
+    """Vecteurs TF-IDF (trigrammes de caractères) des noms canoniques, précalculés une fois.
+
+    Les vecteurs sont creux et normalisés : la similarité cosinus d'un nom scrapé
+    avec tous les noms canoniques est un seul produit scalaire via l'index inversé.
+    """
+
+    def __init__(self, names):
+        docs = [trigrams_of(name) for name in names]
+        n_docs = len(docs)
+        df = {}
+        for counts in docs:
+            for gram in counts:
+                df[gram] = df.get(gram, 0) + 1
+        # IDF lissé ; un trigramme absent de la maquette reçoit le poids maximal
+        self.idf = {gram: math.log((1 + n_docs) / (1 + n)) + 1 for gram, n in df.items()}
+        self.unknown_idf = math.log(1 + n_docs) + 1
+
+        # Index inversé trigramme -> [(index canonique, poids normalisé)]
+        self.postings = {}
+        for idx, counts in enumerate(docs):
+            for gram, weight in self._normalized(counts).items():
+                self.postings.setdefault(gram, []).append((idx, weight))
+
+    def _normalized(self, counts):
+        vector = {gram: n * self.idf.get(gram, self.unknown_idf) for gram, n in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {gram: w / norm for gram, w in vector.items()} if norm else {}
+
+    def scores(self, text):
+        """{ index canonique: similarité cosinus } pour les noms partageant au moins un trigramme"""
+        scores = {}
+        for gram, weight in self._normalized(trigrams_of(text)).items():
+            for idx, canonical_weight in self.postings.get(gram, ()):
+                scores[idx] = scores.get(idx, 0.0) + weight * canonical_weight
+        return scores
+
+    @staticmethod
+    def _pick(scores, cutoff):
+        if not scores:
+            return None
+        # Meilleur score, et à égalité le premier dans l'ordre de la maquette
+        best_idx = min(scores, key=lambda i: (-scores[i], i))
+        return (best_idx, scores[best_idx]) if scores[best_idx] >= cutoff else None
+
+    def best(self, text, cutoff=FUZZY_CUTOFF):
+        """(index canonique, score) le plus similaire au-dessus du seuil, ou None"""
+        return self._pick(self.scores(text), cutoff)
+
+    def best_many(self, texts, cutoff=FUZZY_CUTOFF):
+        """Mode lot : { texte: (index, score) ou None }.
+
+        Produit creux (noms du lot x noms canoniques) calculé en un seul passage :
+        les vecteurs du lot sont regroupés par trigramme, et chaque liste de l'index
+        inversé n'est lue qu'une fois pour tous les noms qui contiennent ce trigramme.
+        """
+        texts = list(dict.fromkeys(texts))
+        # Matrice creuse du lot, par colonne : trigramme -> [(ligne, poids normalisé)]
+        columns = {}
+        for row, text in enumerate(texts):
+            for gram, weight in self._normalized(trigrams_of(text)).items():
+                columns.setdefault(gram, []).append((row, weight))
+        scores = [{} for _ in texts]
+        for gram, entries in columns.items():
+            postings = self.postings.get(gram)
+            if not postings:
+                continue
+            for row, weight in entries:
+                row_scores = scores[row]
+                for idx, canonical_weight in postings:
+                    row_scores[idx] = row_scores.get(idx, 0.0) + weight * canonical_weight
+        return {text: self._pick(row_scores, cutoff) for text, row_scores in zip(texts, scores)}
+
+class CourseMatcher:
+    """Index de correspondance construit une fois par maquette.
+
+    Tout ce qui ne dépend que de la maquette (alias, mots-clés, index inversé,
+    noms d'enseignants) est précalculé.
+    """
+
+    def __init__(self, canonical_names, teacher_map=None, aliases=None, fuzzy_cutoff=FUZZY_CUTOFF, cache_size=MATCH_CACHE_MAX_ENTRIES):
+        self.canonical_names = list(canonical_names)
+        self.aliases = aliases if aliases is not None else load_aliases()
+        self.fuzzy_cutoff = fuzzy_cutoff
+
+        # Identité de ce matcher : change dès que la maquette (noms, enseignants), les alias ou le seuil fuzzy changent
+        identity_source = json.dumps([self.canonical_names, sorted((teacher_map or {}).items()), self.aliases.digest, "tfidf-3", self.fuzzy_cutoff], ensure_ascii=False)
+        self.identity = hashlib.sha1(identity_source.encode('utf-8')).hexdigest()
+
+        # 2. Enseignants : (nom de famille en minuscules, matière), dans l'ordre de la maquette
+        # On découpe "M. Gouméziane" -> "gouméziane"
+        teacher_parts = []
+        for c_name, teacher in (teacher_map or {}).items():
+            if not teacher or len(teacher) < 3: continue
+            parts = teacher.replace("M.", "").replace("Mme", "").split()
+            for part in parts:
+                if len(part) > 3:
+                    teacher_parts.append((part.lower(), c_name))
+        self.teacher_parts = tuple(teacher_parts)
+        # Tous les noms d'enseignants cherchés en un seul passage (comme les alias)
+        self.teacher_automaton = AliasAutomaton([part for part, _ in self.teacher_parts])
+
+        # 3. Index inversé mot-clé -> [(index canonique, nombre d'occurrences)]
+        # Ex: "Systèmes d'information décisionnels" -> ["systèmes", "information", "décisionnels"]
+        self.keyword_index = {}
+        self.prefixes = {} # { longueur: { préfixe: [index canoniques] } } pour le bonus "startswith"
+        self.keyword_ceiling = [] # Score maximal atteignable par chaque canonique (sert à la confiance)
+        for idx, canonical in enumerate(self.canonical_names):
+            clean_canonical = canonical.lower()
+            counts = {}
+            for k in keywords_of(clean_canonical):
+                counts[k] = counts.get(k, 0) + 1
+            for k, n in counts.items():
+                self.keyword_index.setdefault(k, []).append((idx, n))
+            self.keyword_ceiling.append(3 * sum(counts.values()) + 3)
+            prefix = clean_canonical[:10]
+            self.prefixes.setdefault(len(prefix), {}).setdefault(prefix, []).append(idx)
+        self.keywords = tuple(self.keyword_index)
+        # [OPTIMIZATION] Mots-clés compilés dans un automate : un passage sur le nom scrapé
+        # au lieu d'un test "in" par mot-clé de la maquette
+        self.keyword_automaton = AliasAutomaton(self.keywords)
+
+        # 4. Fuzzy : vecteurs TF-IDF de trigrammes des noms canoniques
+        self.fuzzy = TrigramIndex(self.canonical_names)
+
+        self._cache = OrderedDict() # { nom normalisé: décision } borné à cache_size (LRU)
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock() # Matchers partagés entre les threads des requêtes
+
+    @staticmethod
+    def normalize(scraped_name):
+        """Forme normalisée d'un nom scrapé (clé des caches de correspondance)"""
+        return scraped_name.lower().strip()
+
+    def is_known(self, clean_scraped):
+        return clean_scraped in self._cache
+
+    def prime(self, decisions):
+        """Injecte des décisions déjà calculées ailleurs ({ nom normalisé: (canonique, règle, confiance) })"""
+        self._remember(decisions)
+
+    def _remember(self, decisions):
+        with self._cache_lock:
+            self._cache.update(decisions)
+            for name in decisions:
+                self._cache.move_to_end(name)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _decisions(self, clean_names):
+        """{ nom normalisé: décision } pour tous les noms demandés (en mémoire, sinon calculées)"""
+        found, missing = {}, []
+        with self._cache_lock:
+            for name in dict.fromkeys(clean_names):
+                decision = self._cache.get(name)
+                if decision is None:
+                    missing.append(name)
+                else:
+                    self._cache.move_to_end(name)
+                    found[name] = decision
+        # Le résultat ne dépend pas du cache : une éviction pendant le calcul ne perd rien
+        found.update(self.resolve(missing))
+        return found
+
+    def match(self, scraped_name):
+        """Trouve le nom canonique le plus proche avec heuristiques intelligentes (None si rien)"""
+        return self.explain(scraped_name)[0]
+
+    def explain(self, scraped_name):
+        """Décision complète pour un nom : (canonique ou None, règle, confiance)"""
+        clean_scraped = self.normalize(scraped_name)
+        return self._decisions([clean_scraped])[clean_scraped]
+
+    def resolve(self, clean_names):
+        """Calcule en lot les décisions manquantes (noms déjà normalisés) et retourne les nouvelles.
+
+        Les règles exactes passent nom par nom ; les noms restants partent
+        ensemble dans l'index TF-IDF (un seul passage pour tout le lot).
+        """
+        decisions = {}
+        fuzzy_pending = []
+        for clean_scraped in dict.fromkeys(clean_names):
+            if clean_scraped in self._cache:
+                continue
+            decision = self._match_rules(clean_scraped)
+            if decision:
+                decisions[clean_scraped] = decision
+            else:
+                fuzzy_pending.append(clean_scraped)
+
+        # 4. Fallback Fuzzy Match (Dernier recours) : similarité cosinus des trigrammes
+        for clean_scraped, hit in self.fuzzy.best_many(fuzzy_pending, self.fuzzy_cutoff).items():
+            decisions[clean_scraped] = (self.canonical_names[hit[0]], "fuzzy", round(hit[1], 3)) if hit else NO_MATCH
+
+        self._remember(decisions)
+        return decisions
+
+    def match_many(self, items):
+        """Résout tous les éléments d'un coup (noms dédupliqués).
+
+        items : noms ou dicts avec une clé 'name'. Retourne ({ nom: canonique ou None },
+        [{ name, canonical, rule, confidence } pour chaque élément, dans l'ordre]).
+        """
+        names = [item if isinstance(item, str) else item['name'] for item in items]
+        decisions = self._decisions(self.normalize(n) for n in names)
+
+        mapping, details = {}, []
+        for name in names:
+            canonical, rule, confidence = decisions[self.normalize(name)]
+            mapping[name] = canonical
+            details.append({"name": name, "canonical": canonical, "rule": rule, "confidence": confidence})
+        return mapping, details
+
+    def _match_rules(self, clean_scraped):
+        """Règles exactes (alias, enseignant, mots-clés) ; None si aucune ne s'applique"""
+        # 1. Overrides Manuels (un seul passage de l'automate sur le nom)
+        target = self.aliases.lookup(clean_scraped)
+        if target:
+            return (target, "alias", ALIAS_CONFIDENCE)
+
+        # 2. Correspondance par Enseignant (TRÈS FIABLE) : le premier dans l'ordre de la maquette
+        teacher_hits = [idx for _, idx in self.teacher_automaton.find_all(clean_scraped)]
+        if teacher_hits:
+            return (self.teacher_parts[min(teacher_hits)][1], "teacher", TEACHER_CONFIDENCE)
+
+        # 3. Correspondance par Mots-clés Canoniques (Dictionnaire Inversé)
+        # +2 si le mot-clé est dans le nom scrapé (même partiel), +1 si c'est un mot exact
+        scraped_words = set(keywords_of(clean_scraped))
+        scores = {}
+        for k in {self.keywords[idx] for _, idx in self.keyword_automaton.find_all(clean_scraped)}:
+            points = 3 if k in scraped_words else 2
+            for idx, n in self.keyword_index[k]:
+                scores[idx] = scores.get(idx, 0) + points * n
+
+        # Bonus si startswith
+        for length, by_prefix in self.prefixes.items():
+            for idx in by_prefix.get(clean_scraped[:length], ()):
+                scores[idx] = scores.get(idx, 0) + 3
+
+        if scores:
+            # Meilleur score, et à égalité le premier dans l'ordre de la maquette
+            best_idx = min(scores, key=lambda i: (-scores[i], i))
+            if scores[best_idx] >= MIN_KEYWORD_SCORE:
+                confidence = min(1.0, scores[best_idx] / self.keyword_ceiling[best_idx])
+                return (self.canonical_names[best_idx], "keyword", round(confidence, 3))
+
+        return None
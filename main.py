@@ -1,28 +1,68 @@
 import sqlite3
-import re
+import asyncio
 print("🚀 DEBUG: Imports starting...")
 from fastapi import FastAPI, Request, Form, Response, Body
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse
-from scraper import MoodleScraper
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from scraper import AsyncMoodleScraper, SessionExpiredError, SCRAPER_CONCURRENCY
 from maquette_service import MaquetteService
-from difflib import get_close_matches
+from course_matcher import CourseMatcher
+from session_store import ScraperStore, make_session_backend
+from models import Grade, Course, to_json
 from pydantic import BaseModel
 from typing import Optional
 
 from contextlib import asynccontextmanager
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import json
+import hashlib
+import math
+from psycopg2.extras import RealDictCursor, execute_values, execute_batch
+from psycopg2.pool import ThreadedConnectionPool
+import threading
+import weakref
+import sys
 import time
-import random
+from collections import OrderedDict
+from functools import lru_cache
 
 # Configuration DB
 DATABASE_URL = os.getenv("DATABASE_URL")
 DB_FILE = "notes.db"
 
+# Pool de connexions (Postgres) : taille min/max et délai d'inactivité (s) avant un ping de santé
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))
+# Attente maximale (s) d'une connexion libre avant d'échouer (pool saturé)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Nombre de lignes envoyées par aller-retour lors des écritures groupées (Postgres)
+BULK_PAGE_SIZE = 500
+
+# Cache des moyennes calculées : nombre d'entrées max et budget mémoire (Mo)
+STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", "512"))
+STATS_CACHE_MAX_MB = float(os.getenv("STATS_CACHE_MAX_MB", "32"))
+
+# Nombre de rafraîchissements (scraping + synchro) exécutés en parallèle en arrière-plan
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "2"))
+# Durée maximale d'un rafraîchissement (s) : au-delà (plus une marge), un job 'running' est orphelin
+# (worker arrêté pendant le scraping) et peut être repris par un autre worker
+REFRESH_JOB_TIMEOUT = float(os.getenv("REFRESH_JOB_TIMEOUT", "600"))
+REFRESH_JOB_LEASE_MARGIN = 60
+
+# Flux SSE de progression : intervalle des pings (proxy) et nombre de jobs dont on garde l'historique
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+PROGRESS_HISTORY = 200
+
 # --- DB ABSTRACTION LAYER ---
+@lru_cache(maxsize=256)
+def to_postgres_query(query):
+    """Conversion de la syntaxe SQLite (?) vers Postgres (%s), mise en cache par requête"""
+    return query.replace("?", "%s")
+
 class DBCursor:
     def __init__(self, cursor, is_postgres=False):
         self.cursor = cursor
@@ -30,11 +70,18 @@ class DBCursor:
 
     def execute(self, query, params=()):
         if self.is_postgres:
-            # Conversion de la syntaxe SQLite (?) vers Postgres (%s)
-            query = query.replace("?", "%s")
+            query = to_postgres_query(query)
         self.cursor.execute(query, params)
         return self
 
+    def executemany(self, query, seq_of_params):
+        if self.is_postgres:
+            # execute_batch regroupe les requêtes pour limiter les allers-retours réseau
+            execute_batch(self.cursor, to_postgres_query(query), seq_of_params, page_size=BULK_PAGE_SIZE)
+        else:
+            self.cursor.executemany(query, seq_of_params)
+        return self
+
     def fetchone(self):
         return self.cursor.fetchone()
 
@@ -45,13 +92,45 @@ class DBCursor:
         return getattr(self.cursor, name)
 
 class DBConnection:
-    def __init__(self, connection, is_postgres=False):
+    def __init__(self, connection, is_postgres=False, release=None):
         self.connection = connection
         self.is_postgres = is_postgres
+        # Si fourni, close() rend la connexion au pool au lieu de la fermer
+        self._release = release
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.close()
+        return False
 
     def cursor(self):
         return DBCursor(self.connection.cursor(), self.is_postgres)
 
+    def bulk_insert(self, table, columns, rows):
+        """Insère toutes les lignes d'un coup (executemany en SQLite, execute_values en Postgres)"""
+        rows = [tuple(r) for r in rows]
+        if not rows:
+            return 0
+        
+        cols = ", ".join(columns)
+        cursor = self.connection.cursor()
+        if self.is_postgres:
+            # Un seul INSERT ... VALUES (...), (...), ... par page de BULK_PAGE_SIZE lignes
+            execute_values(cursor, f"INSERT INTO {table} ({cols}) VALUES %s", rows, page_size=BULK_PAGE_SIZE)
+        else:
+            placeholders = ", ".join("?" for _ in columns)
+            cursor.executemany(f"INSERT INTO {table} ({cols}) VALUES ({placeholders})", rows)
+        cursor.close()
+        return len(rows)
+
     def commit(self):
         self.connection.commit()
 
@@ -59,7 +138,13 @@ class DBConnection:
         self.connection.rollback()
 
     def close(self):
-        self.connection.close()
+        if self.connection is None:
+            return
+        if self._release is not None:
+            self._release(self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
     
     @property
     def row_factory(self):
@@ -69,24 +154,138 @@ class DBConnection:
     def row_factory(self, value):
         self.connection.row_factory = value
 
+class PostgresPool:
+    """Pool de connexions Postgres thread-safe (attend jusqu'à timeout secondes quand il est plein)"""
+
+    def __init__(self, dsn, min_size, max_size, healthcheck_idle, timeout=DB_POOL_TIMEOUT):
+        self.pool = ThreadedConnectionPool(min_size, max_size, dsn, cursor_factory=RealDictCursor)
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self.last_used = {} # { id(conn): timestamp du dernier retour au pool }
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        # On ne ping que les connexions restées inactives longtemps (coupure serveur/proxy)
+        if time.monotonic() - self.last_used.get(id(conn), 0) < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise RuntimeError(f"Pool Postgres saturé : aucune connexion libre après {self.timeout:g}s ({self.max_size} max)")
+        try:
+            while True:
+                conn = self.pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                print("⚠️ Connexion Postgres morte, remplacement...")
+                self.last_used.pop(id(conn), None)
+                self.pool.putconn(conn, close=True)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            try:
+                # On ne rend jamais une transaction entamée au pool
+                if not conn.closed:
+                    conn.rollback()
+            except Exception:
+                pass
+            if conn.closed:
+                self.last_used.pop(id(conn), None)
+                self.pool.putconn(conn, close=True)
+            else:
+                self.last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn)
+        finally:
+            self.slots.release()
+
+    def closeall(self):
+        self.pool.closeall()
+
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+_sqlite_local = threading.local()
+
+def get_pg_pool():
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                _pg_pool = PostgresPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_HEALTHCHECK_IDLE)
+                print(f"🔌 Pool Postgres prêt ({DB_POOL_MIN}-{DB_POOL_MAX} connexions)")
+    return _pg_pool
+
+def _release_sqlite(conn):
+    # La connexion reste ouverte pour le thread : on annule juste une éventuelle transaction en cours
+    if conn.in_transaction:
+        conn.rollback()
+    _sqlite_local.borrower = None
+
 def get_db_connection():
+    """Emprunte une connexion (pool Postgres ou connexion SQLite du thread courant).
+    close() la rend au pool ; utilisable aussi en 'with' (commit/rollback automatique)."""
     if DATABASE_URL:
         # Postgres Mode
         try:
-            conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-            return DBConnection(conn, is_postgres=True)
+            pool = get_pg_pool()
+            conn = pool.getconn()
+            return DBConnection(conn, is_postgres=True, release=pool.putconn)
         except Exception as e:
             print(f"❌ Erreur connexion Postgres: {e}")
             # Fallback to sqlite if needed, but better to fail explicitly
             raise e
     else:
-        # SQLite Mode
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row
-        return DBConnection(conn, is_postgres=False)
-
-active_scrapers = {} 
+        # SQLite Mode : une connexion persistante par thread, empruntée une seule fois à la fois
+        # (un emprunt imbriqué partagerait la transaction de l'appelant : commit/rollback croisés)
+        cached = getattr(_sqlite_local, "conn", None)
+        borrower = getattr(_sqlite_local, "borrower", None)
+        if borrower is not None and borrower() is not None and cached is not None and cached[0] == DB_FILE:
+            raise RuntimeError("Connexion SQLite déjà empruntée par ce thread : la rendre avant d'en demander une autre")
+        if cached is None or cached[0] != DB_FILE:
+            conn = sqlite3.connect(DB_FILE)
+            conn.row_factory = sqlite3.Row
+            _sqlite_local.conn = (DB_FILE, conn)
+        elif borrower is not None:
+            _release_sqlite(cached[1]) # Emprunt abandonné sans close() (exception) : sa transaction est annulée
+        db_conn = DBConnection(_sqlite_local.conn[1], is_postgres=False, release=_release_sqlite)
+        _sqlite_local.borrower = weakref.ref(db_conn)
+        return db_conn
+
+def close_db_pool():
+    global _pg_pool
+    if _pg_pool is not None:
+        _pg_pool.closeall()
+        _pg_pool = None
+
+# { username: scraper } borné (LRU + expiration après inactivité), restauré depuis la base avec SESSION_BACKEND=db
+active_scrapers = ScraperStore(restore=AsyncMoodleScraper.from_state)
 maquette_service = None # Sera initialisé au démarrage
+refresh_queue = None # File des rafraîchissements en arrière-plan (démarrée au startup)
+
+async def sweep_scrapers(interval=60):
+    while True:
+        await asyncio.sleep(interval)
+        expired = active_scrapers.sweep()
+        if expired:
+            print(f"🧹 {expired} session(s) scraper inactive(s) fermée(s)")
+        try:
+            purged = await active_scrapers.sweep_backend()
+            if purged:
+                print(f"🧹 {purged} session(s) scraper expirée(s) supprimée(s) de la base")
+        except Exception as e:
+            print(f"⚠️ Purge des sessions en base impossible: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -96,16 +295,41 @@ async def lifespan(app: FastAPI):
     # 1. Init DB
     print("🚀 DEBUG: initializing DB...")
     init_db()
+    # Sessions scraper partagées entre workers (chiffrées en base) si SESSION_BACKEND=db
+    active_scrapers.backend = make_session_backend(get_db_connection, SESSION_ENCRYPTION_KEY)
     
-    # 2. Init Maquette Service (Lazy Load)
+    # 2. Init Maquette Service (préchargement + validation de toutes les maquettes)
     global maquette_service
     print("🚀 DEBUG: Loading MaquetteService...")
     maquette_service = MaquetteService()
+    maquette_service.preload()
+    # Vue en lecture seule des maquettes parsées, accessible aux routes via request.app.state
+    app.state.maquettes = maquette_service.catalog
+    # Nettoyage des correspondances calculées pour d'anciennes versions des maquettes / alias
+    try:
+        prune_match_cache(maquette_service.get_matcher(*key).identity for key in maquette_service.catalog)
+    except Exception as e:
+        print(f"⚠️ Nettoyage match_cache ignoré: {e}")
+    
+    # 3. Workers de rafraîchissement (reprend les jobs laissés en cours par un redémarrage)
+    global refresh_queue
+    refresh_queue = RefreshQueue(REFRESH_WORKERS)
+    refresh_queue.start()
+    await refresh_queue.recover()
+    
+    # 4. Fermeture périodique des sessions scraper inactives
+    sweeper = asyncio.create_task(sweep_scrapers())
     print("🚀 DEBUG: Startup complete! Server is ready.")
     
     yield
     # --- SHUTDOWN ---
     print("🚀 DEBUG: Shutting down.")
+    sweeper.cancel()
+    await refresh_queue.stop()
+    for scraper in list(active_scrapers.values()):
+        await scraper.aclose()
+    active_scrapers.clear()
+    close_db_pool()
 
 from starlette.middleware.sessions import SessionMiddleware
 import os
@@ -115,6 +339,8 @@ app = FastAPI(title="Redoublement 8000", lifespan=lifespan)
 # SECURITY: Secret Key for signing sessions (Prevent tampering)
 # In production, use a strong env variable. Fallback for dev.
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-key-changer-me-svp")
+# Chiffrement des sessions scraper stockées en base (obligatoire avec SESSION_BACKEND=db, sans valeur par défaut)
+SESSION_ENCRYPTION_KEY = os.getenv("SESSION_ENCRYPTION_KEY")
 
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY, https_only=False) # https_only=True in prod ideally
 
@@ -137,62 +363,187 @@ async def health_check():
     """Endpoint léger pour le robot de ping (économise les ressources)"""
     return {"status": "alive"}
 
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
+# { nom_index: "table (colonnes)" } créés par init_db
+DB_INDEXES = {
+    "idx_grades_username_course": "grades (username, course_id)",
+    "idx_courses_username": "courses (username)",
+    "idx_manual_grades_username_course": "manual_grades (username, course_canonical_name)",
+    "idx_grade_exclusions_username_course": "grade_exclusions (username, course_canonical_name)",
+}
+
+# Statuts d'un job de rafraîchissement non terminé (prédicat de l'index unique uq_refresh_jobs_active)
+ACTIVE_JOB_FILTER = "status IN ('queued', 'running')"
+
+# --- MIGRATIONS ---
+# Chaque migration est appliquée une seule fois, dans l'ordre, puis enregistrée dans schema_version.
+# Les migrations doivent rester idempotentes (bases déployées avant l'introduction de schema_version).
+
+def table_columns(c, is_postgres, table):
+    """Noms des colonnes d'une table"""
+    if is_postgres:
+        rows = c.execute("SELECT column_name FROM information_schema.columns WHERE table_name = ?", (table,)).fetchall()
+        return {r['column_name'] for r in rows}
+    return {r['name'] for r in c.execute(f"PRAGMA table_info({table})").fetchall()}
+
+def add_column_if_missing(conn, c, table, column, col_type):
+    if column not in table_columns(c, conn.is_postgres, table):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+def migrate_create_tables(conn, c):
     # Types adaptés
     pk_type = "SERIAL PRIMARY KEY" if conn.is_postgres else "INTEGER PRIMARY KEY"
     
     # Postgres ne supporte pas "CREATE TABLE IF NOT EXISTS" pour les types... mais pour les tables oui.
     # On reste simple.
     
-    c.execute(f'''CREATE TABLE IF NOT EXISTS courses (id TEXT, username TEXT, name TEXT, average REAL, PRIMARY KEY (id, username))''')
+    c.execute(f'''CREATE TABLE IF NOT EXISTS courses (id TEXT, username TEXT, name TEXT, average REAL, grades_hash TEXT, PRIMARY KEY (id, username))''')
     c.execute(f'''CREATE TABLE IF NOT EXISTS grades (id {pk_type}, course_id TEXT, username TEXT, name TEXT, grade REAL, max_grade REAL, is_total BOOLEAN)''')
     c.execute(f'''CREATE TABLE IF NOT EXISTS user_settings (username TEXT PRIMARY KEY, semester TEXT, option TEXT, status TEXT, last_updated TEXT)''')
     c.execute(f'''CREATE TABLE IF NOT EXISTS manual_grades (id {pk_type}, username TEXT, course_canonical_name TEXT, name TEXT, grade REAL, max_grade REAL, coef REAL)''')
     c.execute(f'''CREATE TABLE IF NOT EXISTS course_overrides (username TEXT, course_canonical_name TEXT, target_competence TEXT, custom_coef REAL, custom_name TEXT, PRIMARY KEY(username, course_canonical_name))''')
     c.execute(f'''CREATE TABLE IF NOT EXISTS grade_exclusions (id {pk_type}, username TEXT, course_canonical_name TEXT, grade_name TEXT, grade_value REAL)''')
     c.execute(f'''CREATE TABLE IF NOT EXISTS grade_overrides (username TEXT, course_canonical_name TEXT, grade_name TEXT, new_name TEXT, target_course_id TEXT, PRIMARY KEY(username, course_canonical_name, grade_name))''')
-    
-    # On valide d'abord la création des tables pour éviter qu'un fail dans la migration annule tout
-    conn.commit()
-    
-    # Migrations
-    migrations = [
-        "ALTER TABLE user_settings ADD COLUMN last_updated TEXT",
-        "ALTER TABLE courses ADD COLUMN username TEXT",
-        "ALTER TABLE grades ADD COLUMN username TEXT",
-        # Orphan Cleanup: Remove data from the 'ghost' era (NULL username) to clean DB
-        "DELETE FROM courses WHERE username IS NULL",
-        "DELETE FROM grades WHERE username IS NULL"
-    ]
-    
-    for mig in migrations:
-        try:
-            c.execute(mig)
-            conn.commit()
-        except (sqlite3.OperationalError, psycopg2.errors.DuplicateColumn):
-            if conn.is_postgres: conn.rollback()
-        except Exception as e:
-            # print(f"⚠️ Migration warning: {e}")
-            if conn.is_postgres: conn.rollback()
-        
+
+def migrate_add_usernames(conn, c):
+    add_column_if_missing(conn, c, "user_settings", "last_updated", "TEXT")
+    add_column_if_missing(conn, c, "courses", "username", "TEXT")
+    add_column_if_missing(conn, c, "grades", "username", "TEXT")
+
+def migrate_cleanup_orphans(conn, c):
+    # Orphan Cleanup: Remove data from the 'ghost' era (NULL username) to clean DB
+    c.execute("DELETE FROM courses WHERE username IS NULL")
+    c.execute("DELETE FROM grades WHERE username IS NULL")
+
+def migrate_courses_pk(conn, c):
     # [CRITICAL FIX] Drop Constraint on courses_pkey if it is just (id)
     # Postgres specific fix for the error: Key (id)=(...) already exists.
+    if not conn.is_postgres:
+        return
+    # Savepoint : un échec (PK déjà migrée) n'annule que cette étape, pas la transaction de la migration
+    c.execute("SAVEPOINT courses_pk")
+    try:
+        # On essaie de dropper la vieille contrainte PK qui bloque les doublons d'ID entre users
+        c.execute("ALTER TABLE courses DROP CONSTRAINT courses_pkey")
+        c.execute("ALTER TABLE courses ADD PRIMARY KEY (id, username)")
+        c.execute("RELEASE SAVEPOINT courses_pk")
+        print("✅ MIGRATION: Courses PK updated to (id, username)")
+    except Exception:
+        c.execute("ROLLBACK TO SAVEPOINT courses_pk") # Probablement déjà fait
+
+def migrate_grades_hash(conn, c):
+    add_column_if_missing(conn, c, "courses", "grades_hash", "TEXT")
+
+def migrate_indexes(conn, c):
+    # Toutes les requêtes filtrent par username ; course_overrides / grade_overrides
+    # sont déjà couverts par leur clé primaire qui commence par username.
+    for name, ddl in DB_INDEXES.items():
+        c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {ddl}")
+
+def migrate_match_cache(conn, c):
+    # Décisions de find_best_match partagées par toute la promo : { (identité maquette+alias, nom scrapé normalisé): canonique }
+    # + règle appliquée et confiance de chaque décision
+    c.execute("CREATE TABLE IF NOT EXISTS match_cache (maquette_key TEXT, scraped_name TEXT, canonical_name TEXT, rule TEXT, confidence REAL, PRIMARY KEY (maquette_key, scraped_name))")
+
+def migrate_data_version(conn, c):
+    # Compteur incrémenté à chaque modification des données d'un utilisateur (clé du cache des moyennes)
+    add_column_if_missing(conn, c, "user_settings", "data_version", "INTEGER DEFAULT 0")
+
+def migrate_user_snapshots(conn, c):
+    # Tableau de bord précalculé (S3, S4, année) : une lecture par clé primaire pour afficher la page
+    c.execute("CREATE TABLE IF NOT EXISTS user_snapshots (username TEXT PRIMARY KEY, data_version INTEGER, stamp TEXT, payload TEXT, updated_at TEXT)")
+
+def migrate_refresh_jobs(conn, c):
+    # File des rafraîchissements : survit aux redémarrages (statuts queued -> running -> done / failed)
+    pk_type = "SERIAL PRIMARY KEY" if conn.is_postgres else "INTEGER PRIMARY KEY"
+    c.execute(f"CREATE TABLE IF NOT EXISTS refresh_jobs (id {pk_type}, username TEXT, status TEXT, error TEXT, created_at TEXT, started_at TEXT, finished_at TEXT)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_refresh_jobs_username_status ON refresh_jobs (username, status)")
+    # Un seul job actif par utilisateur, garanti par la base (requêtes et workers concurrents)
+    c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_refresh_jobs_active ON refresh_jobs (username) WHERE {ACTIVE_JOB_FILTER}")
+
+def migrate_scraper_sessions(conn, c):
+    # Sessions Moodle (cookies + ID, chiffrés) partagées entre les workers : SESSION_BACKEND=db
+    c.execute("CREATE TABLE IF NOT EXISTS scraper_sessions (username TEXT PRIMARY KEY, payload TEXT, updated_at TEXT)")
+
+def migrate_moodle_accounts(conn, c):
+    # ID Moodle de chaque utilisateur : évite la lecture de /my/ à chaque connexion
+    c.execute("CREATE TABLE IF NOT EXISTS moodle_accounts (username TEXT PRIMARY KEY, user_id TEXT, updated_at TEXT)")
+
+# (version, description, fonction) — ne jamais renuméroter, toujours ajouter à la fin
+MIGRATIONS = [
+    (1, "tables de base", migrate_create_tables),
+    (2, "colonnes username / last_updated", migrate_add_usernames),
+    (3, "nettoyage des lignes sans username", migrate_cleanup_orphans),
+    (4, "clé primaire (id, username) sur courses", migrate_courses_pk),
+    (5, "empreinte des notes (courses.grades_hash)", migrate_grades_hash),
+    (6, "index secondaires par username", migrate_indexes),
+    (7, "cache des correspondances (match_cache)", migrate_match_cache),
+    (8, "version des données utilisateur (user_settings.data_version)", migrate_data_version),
+    (9, "instantanés du tableau de bord (user_snapshots)", migrate_user_snapshots),
+    (10, "file des rafraîchissements (refresh_jobs)", migrate_refresh_jobs),
+    (11, "sessions scraper partagées (scraper_sessions)", migrate_scraper_sessions),
+    (12, "ID Moodle des utilisateurs (moodle_accounts)", migrate_moodle_accounts),
+]
+
+# Clé du verrou consultatif Postgres qui sérialise les migrations entre workers
+MIGRATION_LOCK_ID = 8000
+
+def schema_version(c):
+    row = c.execute("SELECT MAX(version) AS version FROM schema_version").fetchone()
+    return row['version'] or 0
+
+def has_schema_version_table(conn, c):
+    """La table schema_version existe-t-elle ? (lecture du catalogue, sans rien créer ni verrouiller)"""
     if conn.is_postgres:
-        try:
-            # On essaie de dropper la vieille contrainte PK qui bloque les doublons d'ID entre users
-            c.execute("ALTER TABLE courses DROP CONSTRAINT courses_pkey")
-            c.execute("ALTER TABLE courses ADD PRIMARY KEY (id, username)")
-            conn.commit()
-            print("✅ MIGRATION: Courses PK updated to (id, username)")
-        except Exception as e:
-            # print(f"⚠️ MIGRATION PK SKIPPED (probablement déjà fait): {e}")
-            conn.rollback()
-            
+        return c.execute("SELECT to_regclass('schema_version') IS NOT NULL AS found").fetchone()['found']
+    return c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone() is not None
+
+def init_db():
+    conn = get_db_connection()
+    c = conn.cursor()
+    
+    # Schéma à jour : une seule lecture indexée, aucune migration rejouée, aucun verrou
+    current = schema_version(c) if has_schema_version_table(conn, c) else 0
     conn.commit()
-    conn.close()
+    if current >= MIGRATIONS[-1][0]:
+        print(f"✅ Schéma BDD à jour (v{current})")
+        conn.close()
+        return
+    
+    from datetime import datetime
+    # Plusieurs workers démarrent en même temps : un seul applique chaque migration, les autres attendent
+    # (Postgres : verrou consultatif de session ; SQLite : BEGIN IMMEDIATE, relâché à chaque commit)
+    if conn.is_postgres:
+        c.execute("SELECT pg_advisory_lock(?)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+    try:
+        while True:
+            if not conn.is_postgres:
+                c.execute("BEGIN IMMEDIATE")
+            # Créée sous le verrou : deux CREATE TABLE simultanés échouent sur Postgres (index unique de pg_type)
+            c.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at TEXT)")
+            # Version relue sous le verrou : un autre processus a pu migrer entre-temps
+            pending = [m for m in MIGRATIONS if m[0] > schema_version(c)]
+            if not pending:
+                conn.commit()
+                break
+            version, name, migrate = pending[0]
+            migrate(conn, c)
+            c.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                      (version, name, datetime.now().isoformat(timespec="seconds")))
+            conn.commit() # La migration et sa ligne schema_version sont validées ensemble
+            print(f"✅ MIGRATION v{version}: {name}")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ MIGRATION échouée: {e}")
+        raise
+    finally:
+        if conn.is_postgres:
+            try:
+                c.execute("SELECT pg_advisory_unlock(?)", (MIGRATION_LOCK_ID,))
+                conn.commit()
+            except Exception as e:
+                print(f"⚠️ Verrou de migration non relâché: {e}")
+        conn.close()
 
 # --- ROUTES ---
 
@@ -200,14 +551,33 @@ def init_db():
 def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
+def get_moodle_user_id(username):
+    with get_db_connection() as conn:
+        row = conn.cursor().execute("SELECT user_id FROM moodle_accounts WHERE username = ?", (username,)).fetchone()
+    return row['user_id'] if row else None
+
+def save_moodle_user_id(username, user_id):
+    from datetime import datetime
+    with get_db_connection() as conn:
+        conn.cursor().execute("""
+            INSERT INTO moodle_accounts (username, user_id, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(username) DO UPDATE SET user_id = excluded.user_id, updated_at = excluded.updated_at
+        """, (username, user_id, datetime.now().isoformat(timespec="seconds")))
+
 @app.post("/login")
-def login_action(request: Request, username: str = Form(...), password: str = Form(...)): # Included Request
-    # On teste la connexion à l'ENT
-    scraper = MoodleScraper(username, password)
-    if scraper.login():
+async def login_action(request: Request, username: str = Form(...), password: str = Form(...)): # Included Request
+    # On teste la connexion à l'ENT (client async : ne bloque pas de thread pendant le CAS)
+    # [OPTIMIZATION] ID Moodle déjà connu : pas de lecture de /my/ après le CAS
+    known_user_id = await run_in_threadpool(get_moodle_user_id, username)
+    scraper = AsyncMoodleScraper(username, password, known_user_id)
+    if await scraper.login():
         print(f"✅ Connexion réussie pour {username}")
-        # On garde le scraper actif en mémoire
-        active_scrapers[username] = scraper
+        if scraper.user_id and scraper.user_id != known_user_id:
+            await run_in_threadpool(save_moodle_user_id, username, scraper.user_id)
+        # On garde le scraper actif (le store ferme l'ancien client s'il existe et enregistre la session en base)
+        await active_scrapers.put(username, scraper)
+        # Un rafraîchissement resté en attente (redémarrage du serveur) peut maintenant repartir
+        await refresh_queue.recover(username)
         
         # Security: Use Signed Session instead of raw cookie
         request.session['user'] = username
@@ -215,23 +585,146 @@ def login_action(request: Request, username: str = Form(...), password: str = Fo
         response = RedirectResponse(url="/", status_code=303)
         return response
     else:
+        await scraper.aclose()
         return RedirectResponse(url="/login?error=1", status_code=303)
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
+    username = request.session.get("user")
+    if username:
+        await active_scrapers.discard(username) # Cookies Moodle supprimés (mémoire et base)
     request.session.clear()
     response = RedirectResponse(url="/login")
     return response
 
 # --- HELPER FUNCTIONS ---
 
-def is_excluded(course_canonical_name, grade_name, grade_value, exclusions_rows):
+# Écart maximal entre la valeur exclue et la note pour considérer que c'est la même note
+EXCLUSION_TOLERANCE = 0.01
+
+def index_exclusions(exclusions_rows):
+    """Index des exclusions : { (matière, nom de note, tranche de valeur): [valeurs] }.
+    Les tranches font la largeur de la tolérance, une recherche ne regarde donc que 3 tranches."""
+    index = {}
     for ex in exclusions_rows:
-        if ex['course_canonical_name'] == course_canonical_name and ex['grade_name'] == grade_name and abs(ex['grade_value'] - grade_value) < 0.01:
-            return True
+        if ex['grade_value'] is None: continue
+        bucket = math.floor(ex['grade_value'] / EXCLUSION_TOLERANCE)
+        index.setdefault((ex['course_canonical_name'], ex['grade_name'], bucket), []).append(ex['grade_value'])
+    return index
+
+def group_manual_grades(manual_grades):
+    """Notes manuelles regroupées par matière canonique (ordre d'insertion conservé)"""
+    grouped = {}
+    for mg in manual_grades:
+        grouped.setdefault(mg['course_canonical_name'], []).append(mg)
+    return grouped
+
+def is_excluded(course_canonical_name, grade_name, grade_value, exclusions_index):
+    if grade_value is None:
+        return False
+    bucket = math.floor(grade_value / EXCLUSION_TOLERANCE)
+    for b in (bucket - 1, bucket, bucket + 1):
+        for value in exclusions_index.get((course_canonical_name, grade_name, b), ()):
+            if abs(value - grade_value) < EXCLUSION_TOLERANCE:
+                return True
     return False
 
-def calculate_semester_stats(courses_list, manual_grades, overrides_map, grade_overrides_map, exclusions_rows, target_semester, target_option, target_status):
+def in_semester(c_name_lower, target_semester):
+    """Filtre par semestre d'après le nom de la matière"""
+    # --- FILTERING BY SEMESTER in Name ---
+    if target_semester.lower() == "s3" and "s4" in c_name_lower: return False
+    
+    if target_semester.lower() == "s4":
+        if "s3" in c_name_lower: return False
+        if "s4" not in c_name_lower and "semestre 4" not in c_name_lower:
+            return False
+    return True
+
+def route_items(courses_list, semesters):
+    """Éléments à classer par semestre, en un seul parcours des matières :
+    { semestre: [éléments] } (matières filtrées par nom, méta-matières éclatées note par note)"""
+    routed = {sem: [] for sem in semesters}
+    for course in courses_list:
+        c_name_lower = course.name.lower()
+        targets = [sem for sem in semesters if in_semester(c_name_lower, sem)]
+        if not targets: continue
+        
+        # [LOGIC COPIED & ADAPTED FOR SCOPE]
+        is_meta_course = "département sd" in c_name_lower or "espace promo" in c_name_lower
+        items_to_process = []
+        if is_meta_course:
+                for g in course.grades:
+                    if "tendance" in g.name.lower(): continue
+                    items_to_process.append(Course(None, g.name, grades=[g], is_virtual=True))
+        else:
+            items_to_process.append(course)
+        
+        items_to_process = [item for item in items_to_process if "tendance" not in item.name.lower()]
+        for sem in targets:
+            routed[sem].extend(items_to_process)
+    return routed
+
+def resolve_matches(matcher, names):
+    """Pré-remplit le matcher : décisions déjà en mémoire, sinon table match_cache, sinon calcul (puis stockage)"""
+    missing = {CourseMatcher.normalize(n) for n in names}
+    missing = [n for n in missing if not matcher.is_known(n)]
+    if not missing:
+        return
+    try:
+        with get_db_connection() as conn:
+            c = conn.cursor()
+            placeholders = ", ".join("?" for _ in missing)
+            rows = c.execute(f"SELECT scraped_name, canonical_name, rule, confidence FROM match_cache WHERE maquette_key = ? AND scraped_name IN ({placeholders})",
+                             (matcher.identity, *missing)).fetchall()
+            matcher.prime({r['scraped_name']: (r['canonical_name'], r['rule'], r['confidence'] or 0.0) for r in rows})
+            
+            new_rows = [(matcher.identity, n, *decision) for n, decision in matcher.resolve(missing).items()]
+            c.executemany("""
+                INSERT INTO match_cache (maquette_key, scraped_name, canonical_name, rule, confidence) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(maquette_key, scraped_name) DO NOTHING
+            """, new_rows)
+    except Exception as e:
+        # Le cache est facultatif : en cas de souci BDD on calcule simplement en mémoire
+        print(f"⚠️ match_cache indisponible: {e}")
+
+def match_many(items, maquette_key):
+    """Correspondances de tous les éléments d'un semestre en un appel (noms dédupliqués, match_cache partagé).
+
+    Retourne ({ nom scrapé: canonique ou None }, [{ name, canonical, rule, confidence } par élément]).
+    """
+    matcher = maquette_service.get_matcher(*maquette_key)
+    if matcher is None:
+        return {}, []
+    names = [item if isinstance(item, str) else item.name for item in items]
+    resolve_matches(matcher, names)
+    return matcher.match_many(names)
+
+def prune_match_cache(valid_keys):
+    """Supprime les décisions liées à d'anciennes versions de maquette / d'alias"""
+    valid_keys = list(valid_keys)
+    if not valid_keys:
+        return
+    with get_db_connection() as conn:
+        placeholders = ", ".join("?" for _ in valid_keys)
+        conn.cursor().execute(f"DELETE FROM match_cache WHERE maquette_key NOT IN ({placeholders})", valid_keys)
+
+def calculate_semester_stats(courses_list, manual_by_course, overrides_map, grade_overrides_map, exclusions_index, target_semester, target_option, target_status):
+    items = route_items(courses_list, [target_semester])[target_semester]
+    return aggregate_semester(items, manual_by_course, overrides_map, grade_overrides_map, exclusions_index, target_semester, target_option, target_status)
+
+def calculate_year_stats(courses_list, manual_by_course, overrides_map, grade_overrides_map, exclusions_index, target_option, target_status):
+    """S3, S4 et agrégats annuels en un seul parcours des matières : { "S3": stats, "S4": stats, "year": {...} }"""
+    routed = route_items(courses_list, ["S3", "S4"])
+    result = {
+        sem: aggregate_semester(items, manual_by_course, overrides_map, grade_overrides_map, exclusions_index, sem, target_option, target_status)
+        for sem, items in routed.items()
+    }
+    annual_competences, global_year_average = year_aggregates(result["S3"], result["S4"])
+    result["year"] = {"annual_competences": annual_competences, "global_average": global_year_average}
+    return result
+
+def aggregate_semester(items, manual_by_course, overrides_map, grade_overrides_map, exclusions_index, target_semester, target_option, target_status):
+    """Moyennes d'un semestre à partir de ses éléments déjà routés (voir route_items)"""
     maquette = maquette_service.load_maquette(target_semester, target_option, target_status)
     if not maquette: return None
 
@@ -240,83 +733,62 @@ def calculate_semester_stats(courses_list, manual_grades, overrides_map, grade_o
         competences_data[comp] = {"courses": [], "weighted_sum": 0, "coef_sum": 0, "average": None}
     
     canonical_names = list(maquette['courses'].keys())
-    teacher_map = maquette.get('teachers', {})
     canonical_registry = {} 
     unmatched_items = []
 
     # Process Courses
-    for course in courses_list:
-        # --- FILTERING BY SEMESTER in Name ---
-        c_name_lower = course['name'].lower()
-        
-        if target_semester.lower() == "s3" and "s4" in c_name_lower: continue
-        
-        if target_semester.lower() == "s4":
-            if "s3" in c_name_lower: continue
-            if "s4" not in c_name_lower and "semestre 4" not in c_name_lower:
-                continue
-        
-        # [LOGIC COPIED & ADAPTED FOR SCOPE]
-        is_meta_course = "département sd" in c_name_lower or "espace promo" in c_name_lower
-        items_to_process = []
-        if is_meta_course:
-                for g in course['grades']:
-                    if "tendance" in g['name'].lower(): continue
-                    items_to_process.append({"name": g['name'], "grades": [g], "is_virtual": True})
-        else:
-            items_to_process.append(course)
+    # [OPTIMIZATION] Toutes les correspondances du semestre résolues en un seul appel
+    matches, _ = match_many(items, (target_semester, target_option, target_status))
+    
+    for item in items:
+        best_match = matches[item.name]
         
-        for item in items_to_process:
-            if "tendance" in item.get('name', '').lower(): continue
-            
-            # Re-using the same global find_best_match function
-            best_match = find_best_match(item['name'], canonical_names, teacher_map)
+        if best_match:
+            if best_match not in canonical_registry: canonical_registry[best_match] = {"grades": [], "matches": []}
             
-            if best_match:
-                if best_match not in canonical_registry: canonical_registry[best_match] = {"grades": [], "matches": []}
-                
-                for g in item.get('grades', []):
-                    g_name_lower = g['name'].lower()
-                    if "tendance" in g_name_lower: continue
+            for g in item.grades:
+                g_name_lower = g.name.lower()
+                if "tendance" in g_name_lower: continue
 
-                    # [FEATURE] Apply Grade Renaming / Moving
-                    override = grade_overrides_map.get((best_match, g['name']))
-                    
-                    target_structure = canonical_registry[best_match]
-                    final_grade = g.copy() # Avoid mutating original reference
-                    
-                    if override:
-                        if override.get('new_name'):
-                            final_grade['name'] = override['new_name']
-                        
-                        # Move to another course?
-                        if override.get('target_course_id'):
-                            target_c_name = override['target_course_id']
-                            if target_c_name not in canonical_registry:
-                                canonical_registry[target_c_name] = {"grades": [], "matches": ["[MOVED_TARGET]"]}
-                            target_structure = canonical_registry[target_c_name]
+                # [FEATURE] Apply Grade Renaming / Moving
+                override = grade_overrides_map.get((best_match, g.name))
+                
+                target_structure = canonical_registry[best_match]
+                final_grade = g # [OPTIMIZATION] Partagée tant qu'elle n'est pas modifiée (copie seulement si renommée / exclue)
+                
+                if override:
+                    if override.get('new_name'):
+                        final_grade = g.with_changes(name=override['new_name'])
                     
-                    target_structure["grades"].append(final_grade)
+                    # Move to another course?
+                    if override.get('target_course_id'):
+                        target_c_name = override['target_course_id']
+                        if target_c_name not in canonical_registry:
+                            canonical_registry[target_c_name] = {"grades": [], "matches": ["[MOVED_TARGET]"]}
+                        target_structure = canonical_registry[target_c_name]
+                
+                target_structure["grades"].append(final_grade)
 
-                canonical_registry[best_match]["matches"].append(item['name'])
-            else:
-                if target_semester.lower() in item['name'].lower(): # Only keep unmatched if they belong to this semester
-                        unmatched_items.append(item)
+            canonical_registry[best_match]["matches"].append(item.name)
+        else:
+            if target_semester.lower() in item.name.lower(): # Only keep unmatched if they belong to this semester
+                    unmatched_items.append(item)
 
     # Inject Manuals (Filtered by Maquette existence)
     for c_name in canonical_names:
-        my_manuals = [mg for mg in manual_grades if mg['course_canonical_name'] == c_name]
+        my_manuals = manual_by_course.get(c_name)
         if my_manuals:
             if c_name not in canonical_registry: canonical_registry[c_name] = {"grades": [], "matches": ["[MANUAL]"]}
             for mg in my_manuals:
-                canonical_registry[c_name]["grades"].append({
-                    "name": "📝 " + mg['name'], "grade": mg['grade'], "max_grade": mg['max_grade'], "is_total": False, "is_manual": True, "id": mg['id'] 
-                })
+                canonical_registry[c_name]["grades"].append(
+                    Grade("📝 " + mg['name'], mg['grade'], mg['max_grade'], is_manual=True, id=mg['id'])
+                )
              # Exclusions
         if c_name in canonical_registry:
-            for g in canonical_registry[c_name]["grades"]:
-                g_clean_name = g['name'].replace("📝 ", "") 
-                if is_excluded(c_name, g_clean_name, g['grade'], exclusions_rows): g['is_excluded'] = True
+            c_grades = canonical_registry[c_name]["grades"]
+            for i, g in enumerate(c_grades):
+                g_clean_name = g.name.replace("📝 ", "") 
+                if is_excluded(c_name, g_clean_name, g.grade, exclusions_index): c_grades[i] = g.with_changes(is_excluded=True)
 
     # Distribution
     for c_name, data in canonical_registry.items():
@@ -343,9 +815,9 @@ def calculate_semester_stats(courses_list, manual_grades, overrides_map, grade_o
 
         all_grades_vals = []
         for g in data['grades']:
-            if g.get('grade') is not None and not g.get('is_total') and not g.get('is_excluded'):
-                local_max = g.get('max_grade', 20)
-                local_grade = g['grade']
+            if g.grade is not None and not g.is_total and not g.is_excluded:
+                local_max = g.max_grade
+                local_grade = g.grade
                 if local_max == 100 and local_grade <= 20: local_max = 20.0
                 normalized = (local_grade / local_max) * 20 if local_max > 0 else local_grade
                 all_grades_vals.append(normalized)
@@ -382,8 +854,230 @@ def calculate_semester_stats(courses_list, manual_grades, overrides_map, grade_o
         "comp_averages": result_avgs
     }
 
+# --- DATA ACCESS ---
+
+def bump_data_version(c, username):
+    """Invalide les moyennes en cache de l'utilisateur (à appeler dans la transaction qui modifie ses données)"""
+    c.execute("UPDATE user_settings SET data_version = COALESCE(data_version, 0) + 1 WHERE username = ?", (username,))
+
+def approx_size(obj, seen=None):
+    """Taille mémoire approximative (octets) d'une structure de dicts / listes"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(approx_size(v, seen) for v in obj)
+    elif isinstance(obj, (Grade, Course)):
+        size += sum(approx_size(getattr(obj, name), seen) for name in obj.__slots__)
+    return size
+
+class StatsCache:
+    """LRU des résultats de calculate_semester_stats, borné en nombre d'entrées et en mémoire.
+
+    Clé : (username, version des données, semestre, option, statut). Une entrée n'est
+    resservie que si la maquette et le matcher utilisés pour la calculer sont toujours
+    ceux en service (rechargement d'un CSV ou d'aliases.json).
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # clé -> (stats, dépendances, taille)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, deps):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or any(a is not b for a, b in zip(entry[1], deps)):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, stats, deps):
+        size = approx_size(stats)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # Les versions précédentes de cet utilisateur ne seront plus jamais demandées
+            stale = [k for k in self._entries if k[0] == key[0] and k[1] != key[1]]
+            for k in stale + ([key] if key in self._entries else []):
+                self._bytes -= self._entries.pop(k)[2]
+            self._entries[key] = (stats, deps, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+stats_cache = StatsCache(STATS_CACHE_MAX_ENTRIES, int(STATS_CACHE_MAX_MB * 1024 * 1024))
+
+def load_user_data(c, username):
+    """Charge toutes les données d'un utilisateur pour le calcul des moyennes,
+    en un nombre fixe de requêtes (plus de requête par matière)"""
+    courses_rows = c.execute("SELECT * FROM courses WHERE username = ?", (username,)).fetchall()
+    grades_rows = c.execute("SELECT * FROM grades WHERE username = ?", (username,)).fetchall()
+    manual_grades_rows = c.execute("SELECT * FROM manual_grades WHERE username = ?", (username,)).fetchall()
+    overrides_rows = c.execute("SELECT * FROM course_overrides WHERE username = ?", (username,)).fetchall()
+    grade_overrides_rows = c.execute("SELECT * FROM grade_overrides WHERE username = ?", (username,)).fetchall()
+    exclusions_rows = c.execute("SELECT * FROM grade_exclusions WHERE username = ?", (username,)).fetchall()
+
+    # Regroupement des notes par matière (en conservant l'ordre d'insertion)
+    # [OPTIMIZATION] Enregistrements compacts (__slots__) au lieu d'une copie dict par ligne
+    grades_by_course = {}
+    for g in grades_rows:
+        grades_by_course.setdefault(g['course_id'], []).append(Grade.from_row(g))
+
+    courses_list = [Course.from_row(r, grades_by_course.get(r['id'], [])) for r in courses_rows]
+
+    return {
+        "username": username,
+        "courses": courses_list,
+        # [OPTIMIZATION] Index par matière : plus de parcours complet par matière / par note
+        "manual_grades": group_manual_grades(dict(r) for r in manual_grades_rows),
+        "overrides_map": {r['course_canonical_name']: dict(r) for r in overrides_rows},
+        "grade_overrides_map": {(r['course_canonical_name'], r['grade_name']): dict(r) for r in grade_overrides_rows},
+        "exclusions": index_exclusions(exclusions_rows),
+    }
+
+def memoized_stats(user_data, version, semester, option, status, compute):
+    """Résultat de compute() mémoïsé sous (username, version, semestre, option, statut) si version est donnée.
+    Le résultat est partagé entre les requêtes et ne doit pas être modifié."""
+    if version is None:
+        return compute()
+    key = (user_data["username"], version, semester, option, status)
+    semesters = ("S3", "S4") if semester == "YEAR" else (semester,)
+    deps = tuple(dep for sem in semesters for dep in (maquette_service.load_maquette(sem, option, status), maquette_service.get_matcher(sem, option, status)))
+    stats = stats_cache.get(key, deps)
+    if stats is None:
+        stats = compute()
+        if stats is not None:
+            stats_cache.put(key, stats, deps)
+    return stats
+
+def stats_for(user_data, semester, option, status, version=None):
+    """Raccourci : calculate_semester_stats sur les données chargées par load_user_data
+    (mémoïsé avec la version des données, user_settings.data_version)"""
+    return memoized_stats(user_data, version, semester, option, status, lambda: calculate_semester_stats(
+        user_data["courses"], user_data["manual_grades"], user_data["overrides_map"],
+        user_data["grade_overrides_map"], user_data["exclusions"],
+        semester, option, status
+    ))
+
+def year_stats_for(user_data, option, status, version=None):
+    """Raccourci : calculate_year_stats (S3 + S4 + année) sur les données chargées par load_user_data"""
+    return memoized_stats(user_data, version, "YEAR", option, status, lambda: calculate_year_stats(
+        user_data["courses"], user_data["manual_grades"], user_data["overrides_map"],
+        user_data["grade_overrides_map"], user_data["exclusions"],
+        option, status
+    ))
+
+def year_aggregates(s3_stats, s4_stats):
+    """Moyennes annuelles par UE et moyenne de l'année à partir des stats S3 et S4"""
+    # Calculate Année Average: Moyenne des 4 UE (Aggrégées)
+    # On suppose UE1 Année = (UE1 S3 + UE1 S4) / 2
+    # Si une UE manque dans un semestre, on prend celle qui existe.
+    
+    annual_competences = {} # "UE 1": 12.5
+    all_ue_keys = set()
+    if s3_stats: all_ue_keys.update(s3_stats['comp_averages'].keys())
+    if s4_stats: all_ue_keys.update(s4_stats['comp_averages'].keys())
+    
+    # Mapping simple (UE 1 ... -> UE 1)
+    # Attention: dans le CSV S3 c'est "Compétence 1...", S4 aussi. Les clés doivent matcher.
+    
+    final_sum = 0
+    final_count = 0
+    
+    for ue_key in sorted(all_ue_keys):
+        # Clean key name helper if needed
+        val_s3 = s3_stats['comp_averages'].get(ue_key) if s3_stats else None
+        val_s4 = s4_stats['comp_averages'].get(ue_key) if s4_stats else None
+        
+        values = [v for v in [val_s3, val_s4] if v is not None]
+        if values:
+            avg_ue = sum(values) / len(values)
+            annual_competences[ue_key] = avg_ue
+            final_sum += avg_ue
+            final_count += 1
+            
+    global_year_average = final_sum / final_count if final_count > 0 else None
+    return annual_competences, global_year_average
+
+# --- SNAPSHOTS ---
+# Résultat complet du tableau de bord (S3, S4, année) sérialisé en JSON compact dans user_snapshots.
+# Un instantané n'est servi que s'il a été calculé pour la version courante des données
+# (data_version) et avec les mêmes maquettes / option / statut (stamp).
+
+def snapshot_stamp(settings):
+    option, status = settings['option'], settings['status']
+    parts = [option, status] + [maquette_service.fingerprint(sem, option, status) for sem in ("S3", "S4")]
+    return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
+
+def build_snapshot(user_data, settings):
+    """Calcule le tableau de bord complet d'un utilisateur (S3, S4 et agrégats annuels).
+    À appeler sans connexion empruntée : resolve_matches() prend la sienne pour match_cache."""
+    if not user_data["courses"]:
+        return {"has_courses": False}
+    # [OPTIMIZATION] S3, S4 et année calculés en un seul parcours
+    year_stats = year_stats_for(user_data, settings['option'], settings['status'], settings['data_version'] or 0)
+    return {"has_courses": True, **year_stats}
+
+def save_snapshot(c, username, settings, snapshot):
+    from datetime import datetime
+    payload = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'), default=to_json)
+    # Un instantané plus ancien (écritures concurrentes) n'écrase jamais un plus récent
+    c.execute("""
+        INSERT INTO user_snapshots (username, data_version, stamp, payload, updated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(username) DO UPDATE SET data_version = excluded.data_version, stamp = excluded.stamp,
+            payload = excluded.payload, updated_at = excluded.updated_at
+        WHERE user_snapshots.data_version <= excluded.data_version
+    """, (username, settings['data_version'] or 0, snapshot_stamp(settings), payload, datetime.now().isoformat(timespec="seconds")))
+
+def load_snapshot(c, username, settings):
+    """Instantané à jour de l'utilisateur (lecture par clé primaire), ou None s'il faut le recalculer"""
+    row = c.execute("SELECT data_version, stamp, payload FROM user_snapshots WHERE username = ?", (username,)).fetchone()
+    if not row or row['data_version'] != (settings['data_version'] or 0) or row['stamp'] != snapshot_stamp(settings):
+        return None
+    return json.loads(row['payload'])
+
+def refresh_user_snapshot(username):
+    """Recalcule et enregistre l'instantané après une modification des données (refresh, personnalisations)"""
+    try:
+        with get_db_connection() as conn:
+            c = conn.cursor()
+            settings = c.execute("SELECT * FROM user_settings WHERE username = ?", (username,)).fetchone()
+            user_data = load_user_data(c, username) if settings else None
+        if settings:
+            snapshot = build_snapshot(user_data, settings)
+            with get_db_connection() as conn:
+                save_snapshot(conn.cursor(), username, settings, snapshot)
+    except Exception as e:
+        # L'instantané est facultatif : home() le recalculera à la prochaine lecture
+        print(f"⚠️ Instantané non enregistré pour {username}: {e}")
+
+def apply_user_change(username, query, params):
+    """Enregistre une personnalisation de l'utilisateur puis recalcule son instantané.
+    Appelée via run_in_threadpool : l'attente d'une connexion du pool ne bloque pas la boucle asyncio."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        bump_data_version(c, username)
+    refresh_user_snapshot(username)
+
 @app.get("/", response_class=HTMLResponse)
-def home(request: Request, view: str = "dashboard"): # Default view
+def home(request: Request, view: str = "dashboard", job: Optional[int] = None): # Default view ; job = rafraîchissement en cours
     username = request.session.get("user")
     if not username:
         return RedirectResponse(url="/login")
@@ -418,14 +1112,19 @@ def home(request: Request, view: str = "dashboard"): # Default view
     
     context_semester = view.upper() # S3 or S4
     
-    courses_list = []
-    # Fetch ALL courses for the user (we filter later based on view)
-    rows = c.execute("SELECT * FROM courses WHERE username = ?", (username,)).fetchall()
+    # [OPTIMIZATION] Tableau de bord précalculé : une lecture par clé primaire au lieu du calcul complet
+    snapshot = load_snapshot(c, username, settings)
+    user_data = load_user_data(c, username) if snapshot is None else None
+    conn.close()
+    if snapshot is None:
+        # Calcul connexion rendue (le matching emprunte la sienne), puis enregistrement sur une nouvelle
+        snapshot = build_snapshot(user_data, settings)
+        with get_db_connection() as conn:
+            save_snapshot(conn.cursor(), username, settings, snapshot)
     
     # [FIX] Si aucune donnée en base (nouvel utilisateur ou jamais scrapé),
     # on renvoie direct une structure vide pour déclencher le "Empty State" du template.
-    if not rows:
-        conn.close()
+    if not snapshot["has_courses"]:
         return templates.TemplateResponse("index.html", {
             "request": request,
             "competences": {}, # Force empty to trigger Welcome Screen
@@ -433,34 +1132,10 @@ def home(request: Request, view: str = "dashboard"): # Default view
             "is_admin": (username == "pesthor"),
             "global_average": None,
             "settings": settings,
-            "view": view
+            "view": view,
+            "refresh_job": job
         })
 
-    for row in rows:
-        course = dict(row)
-
-        grades = c.execute("SELECT * FROM grades WHERE course_id = ? AND username = ?", (course['id'], username)).fetchall()
-        course['grades'] = [dict(g) for g in grades]
-        courses_list.append(course)
-
-    # 1b. Fetch User Overrides & Manual Grades
-    manual_grades_rows = c.execute("SELECT * FROM manual_grades WHERE username = ?", (username,)).fetchall()
-    overrides_rows = c.execute("SELECT * FROM course_overrides WHERE username = ?", (username,)).fetchall()
-    
-    # [NEW] Fetch Grade Overrides
-    grade_overrides_rows = c.execute("SELECT * FROM grade_overrides WHERE username = ?", (username,)).fetchall()
-    grade_overrides_map = {(r['course_canonical_name'], r['grade_name']): dict(r) for r in grade_overrides_rows}
-    
-    manual_grades = [dict(r) for r in manual_grades_rows]
-    overrides_map = {r['course_canonical_name']: dict(r) for r in overrides_rows}
-    
-    # 1c. Fetch Grade Exclusions
-    exclusions_rows = c.execute("SELECT * FROM grade_exclusions WHERE username = ?", (username,)).fetchall()
-    
-
-    
-    conn.close()
-
     if view == "settings":
          return templates.TemplateResponse("settings.html", {
             "request": request,
@@ -469,66 +1144,31 @@ def home(request: Request, view: str = "dashboard"): # Default view
             "view": "settings"
         })
 
-    # --- CALCULATION LOGIC ---
-
-
     # --- RENDER LOGIC ---
     
     if view == "year":
         # Aggregate S3 + S4
-        s3_stats = calculate_semester_stats(courses_list, manual_grades, overrides_map, grade_overrides_map, exclusions_rows, "S3", settings['option'], settings['status'])
-        s4_stats = calculate_semester_stats(courses_list, manual_grades, overrides_map, grade_overrides_map, exclusions_rows, "S4", settings['option'], settings['status'])
-        
-        year_data = {"S3": s3_stats, "S4": s4_stats}
-        
-        # Calculate Année Average: Moyenne des 4 UE (Aggrégées)
-        # On suppose UE1 Année = (UE1 S3 + UE1 S4) / 2
-        # Si une UE manque dans un semestre, on prend celle qui existe.
-        
-        annual_competences = {} # "UE 1": 12.5
-        all_ue_keys = set()
-        if s3_stats: all_ue_keys.update(s3_stats['comp_averages'].keys())
-        if s4_stats: all_ue_keys.update(s4_stats['comp_averages'].keys())
-        
-        # Mapping simple (UE 1 ... -> UE 1)
-        # Attention: dans le CSV S3 c'est "Compétence 1...", S4 aussi. Les clés doivent matcher.
-        
-        final_sum = 0
-        final_count = 0
-        
-        for ue_key in sorted(all_ue_keys):
-            # Clean key name helper if needed
-            val_s3 = s3_stats['comp_averages'].get(ue_key) if s3_stats else None
-            val_s4 = s4_stats['comp_averages'].get(ue_key) if s4_stats else None
-            
-            values = [v for v in [val_s3, val_s4] if v is not None]
-            if values:
-                avg_ue = sum(values) / len(values)
-                annual_competences[ue_key] = avg_ue
-                final_sum += avg_ue
-                final_count += 1
-                
-        global_year_average = final_sum / final_count if final_count > 0 else None
+        year_data = {"S3": snapshot["S3"], "S4": snapshot["S4"]}
         
         return templates.TemplateResponse("dashboard_year.html", {
             "request": request,
             "user": username,
             "stats": year_data,
-            "annual_competences": annual_competences,
-            "global_average": global_year_average,
+            "annual_competences": snapshot["year"]["annual_competences"],
+            "global_average": snapshot["year"]["global_average"],
             "view": "year"
         })
 
     else:
         # Standard Semester View (S3 or S4)
-        stats = calculate_semester_stats(courses_list, manual_grades, overrides_map, grade_overrides_map, exclusions_rows, context_semester, settings['option'], settings['status'])
+        stats = snapshot.get(context_semester)
         
         # Fallback empty structure if calc fails (e.g. no maquette)
         if not stats: 
             competences_data = {"Erreur": {"courses": [], "average": None}}
             global_average = None
         else:
-            competences_data = stats['competences']
+            competences_data = dict(stats['competences'])
             # Add Unmatched
             if stats['unmatched']:
                 competences_data["Matières non classées"] = {"courses": stats['unmatched'], "average": None}
@@ -536,119 +1176,73 @@ def home(request: Request, view: str = "dashboard"): # Default view
 
         return templates.TemplateResponse("index.html", {
         "request": request,
-        "competences": stats['competences'],
+        "competences": competences_data,
         "unmatched": stats['unmatched'],
         "user": username,
         "is_admin": (username == "pesthor"),
         "global_average": stats['average'],
         "comp_averages": stats['comp_averages'],
         "settings": settings,
-        "view": view
+        "view": view,
+        "refresh_job": job
     })
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
-@app.get("/refresh-ui")
-@app.get("/refresh-ui")
-def refresh_ui(request: Request):
-    username = request.session.get("user")
-    
-    print(f"🔄 REFRESH REQUEST for user: {username}")
-    
-    if not username or username not in active_scrapers:
-        print("❌ Scraper not found or user not logged in. Redirecting to login.")
-        return RedirectResponse(url="/login")
-    
-    scraper = active_scrapers[username]
+def course_fingerprint(course_name, grades):
+    """Empreinte (SHA-1) d'une matière scrapée : nom + liste ordonnée de ses notes"""
+    payload = [course_name] + [[g['name'], g['grade'], g['max_grade'], bool(g['is_total'])] for g in grades]
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
 
-    # --- ÉTAPE 1 : NETTOYAGE PRÉALABLE (Anti-Doublons) ---
-    # On supprime tout AVANT de scraper pour être sûr de partir d'une page blanche
-    try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        print(f"🧹 Nettoyage de la base pour {username}...")
-        c.execute("DELETE FROM grades WHERE username = ?", (username,))
-        c.execute("DELETE FROM courses WHERE username = ?", (username,))
-        conn.commit() # On valide immédiatement la suppression
-        conn.close()
-    except Exception as e:
-        print(f"❌ Erreur lors du nettoyage BDD: {e}")
-
-    # --- ÉTAPE 2 : SCRAPING ---
-    print("🔄 Début du scraping...")
-    try:
-        if not scraper.is_connected:
-            scraper.login()
-        raw_courses = scraper.get_all_courses()
-    except Exception as e:
-        print(f"❌ Erreur SCRAPING exception: {e}")
-        raw_courses = []
-
-    print(f"📚 {len(raw_courses)} matières trouvées. Lancement SÉQUENTIEL...")
-    
-    courses_data = []
-    seen_ids = set() # Pour empêcher d'ajouter deux fois la même matière
-
-    for course in raw_courses:
-        # 1. Filtre anti-doublon sur l'ID de la matière
-        c_id = str(course['id'])
-        if c_id in seen_ids:
-            continue
-        seen_ids.add(c_id)
-
-        time.sleep(random.uniform(0.1, 0.3)) 
-        try:
-            print(f"   📥 Scraping: {course['name']}...")
-            grades = scraper.get_grades_for_course(course['id'])
-            
-            # Filtre anti-doublon sur les notes (parfois Moodle met la note et le total avec le même nom)
-            unique_grades = []
-            seen_grade_names = set()
-            
-            for g in grades:
-                # Clé unique pour une note : Nom + Valeur
-                g_key = f"{g['name']}_{g['grade']}"
-                if g_key not in seen_grade_names:
-                    unique_grades.append(g)
-                    seen_grade_names.add(g_key)
-
-            # Calcul moyenne
-            notes_valides = [g['grade'] for g in unique_grades if g['max_grade'] == 20 and not g['is_total']]
-            avg = sum(notes_valides) / len(notes_valides) if notes_valides else None
-            
-            courses_data.append({
-                "course": course,
-                "grades": unique_grades,
-                "average": avg
-            })
-        except Exception as e:
-            print(f"⚠️ Erreur scraping grades pour {course.get('name')}: {e}")
-
-    print("✅ Scraping terminé. Insertion en BDD...")
-
-    # --- ÉTAPE 3 : INSERTION ---
+def sync_user_courses(username, courses_data, failed_ids=()):
+    """Synchronisation différentielle : ne réécrit que les matières dont les notes ont changé.
+    failed_ids : matières dont le scraping a échoué, conservées telles quelles en base."""
     try:
         conn = get_db_connection()
         c = conn.cursor()
         
-        # Double sécurité : On re-supprime au cas où (pour les accès concurrents)
-        c.execute("DELETE FROM grades WHERE username = ?", (username,))
-        c.execute("DELETE FROM courses WHERE username = ?", (username,))
+        stored = {r['id']: r['grades_hash'] for r in c.execute("SELECT id, grades_hash FROM courses WHERE username = ?", (username,)).fetchall()}
+        scraped_ids = {str(c_id) for c_id in failed_ids} # Une matière en échec n'est ni réécrite ni supprimée
+        changed_ids = []
+        new_courses = []
+        updated_courses = []
+        grade_rows = []
         
-        count_courses = 0
         for item in courses_data:
             c_info = item['course']
-            c.execute("INSERT INTO courses (id, username, name, average) VALUES (?, ?, ?, ?)", 
-                      (c_info['id'], username, c_info['name'], item['average']))
-            count_courses += 1
+            c_id = str(c_info['id'])
+            scraped_ids.add(c_id)
+            new_hash = course_fingerprint(c_info['name'], item['grades'])
+            
+            # Matière identique à ce qui est stocké : on ne touche à rien
+            if c_id in stored and stored[c_id] == new_hash:
+                continue
+            
+            if c_id in stored:
+                changed_ids.append(c_id)
+                updated_courses.append((c_info['name'], item['average'], new_hash, c_id, username))
+            else:
+                new_courses.append((c_id, username, c_info['name'], item['average'], new_hash))
             
             for g in item['grades']:
-                c.execute("INSERT INTO grades (course_id, username, name, grade, max_grade, is_total) VALUES (?, ?, ?, ?, ?, ?)", 
-                          (c_info['id'], username, g['name'], g['grade'], g['max_grade'], g['is_total']))
+                grade_rows.append((c_id, username, g['name'], g['grade'], g['max_grade'], g['is_total']))
         
-        print(f"💾 BDD UPDATE: Inserted {count_courses} courses for {username}")
+        # Matières disparues de Moodle (uniquement si le scraping a renvoyé quelque chose,
+        # pour ne pas vider la base sur une erreur réseau)
+        removed_ids = [c_id for c_id in stored if c_id not in scraped_ids] if courses_data else []
+        
+        # [OPTIMIZATION] Écritures groupées : un aller-retour par type d'opération au lieu d'un par ligne
+        c.executemany("DELETE FROM grades WHERE course_id = ? AND username = ?", [(c_id, username) for c_id in changed_ids + removed_ids])
+        c.executemany("DELETE FROM courses WHERE id = ? AND username = ?", [(c_id, username) for c_id in removed_ids])
+        c.executemany("UPDATE courses SET name = ?, average = ?, grades_hash = ? WHERE id = ? AND username = ?", updated_courses)
+        conn.bulk_insert("courses", ("id", "username", "name", "average", "grades_hash"), new_courses)
+        conn.bulk_insert("grades", ("course_id", "username", "name", "grade", "max_grade", "is_total"), grade_rows)
+        count_changed = len(changed_ids) + len(new_courses)
+        
+        count_unchanged = len(courses_data) - count_changed
+        print(f"💾 BDD SYNC: {count_changed} modifiées, {count_unchanged} inchangées, {len(removed_ids)} supprimées pour {username}")
 
         # Mise à jour date et Defaults
         from datetime import datetime
@@ -660,14 +1254,377 @@ def refresh_ui(request: Request):
             VALUES (?, 'S3', 'EMS', 'FI', ?)
             ON CONFLICT(username) DO UPDATE SET last_updated = excluded.last_updated
         """, (username, now))
+        if count_changed or removed_ids:
+            bump_data_version(c, username)
 
         conn.commit()
     except Exception as e:
         print(f"❌ Erreur BDD: {e}")
+        raise # Le job de rafraîchissement est marqué "failed"
     finally:
         conn.close()
+
+def build_course_data(course, grades):
+    """Dédoublonne les notes d'une matière scrapée et calcule sa moyenne brute"""
+    # Filtre anti-doublon sur les notes (parfois Moodle met la note et le total avec le même nom)
+    unique_grades = []
+    seen_grade_names = set()
     
-    return RedirectResponse(url="/", status_code=303)
+    for g in grades:
+        # Clé unique pour une note : Nom + Valeur
+        g_key = f"{g['name']}_{g['grade']}"
+        if g_key not in seen_grade_names:
+            unique_grades.append(g)
+            seen_grade_names.add(g_key)
+
+    # Calcul moyenne
+    notes_valides = [g['grade'] for g in unique_grades if g['max_grade'] == 20 and not g['is_total']]
+    avg = sum(notes_valides) / len(notes_valides) if notes_valides else None
+    
+    return {
+        "course": course,
+        "grades": unique_grades,
+        "average": avg
+    }
+
+async def run_refresh(username, scraper, progress=None):
+    """Rafraîchissement complet d'un utilisateur : scraping, synchro différentielle, instantané.
+    Les étapes sont publiées dans progress (JobProgress) pour le flux SSE."""
+    started = time.perf_counter()
+    def emit(event, **data):
+        if progress is not None:
+            progress.publish(event, {**data, "elapsed_ms": int((time.perf_counter() - started) * 1000)})
+    
+    # --- ÉTAPE 1 : SCRAPING ---
+    # (plus de nettoyage préalable : la synchro différentielle de l'étape 2 remplace le DELETE global)
+    # Les erreurs de scraping remontent jusqu'au worker : le job passe en "failed" au lieu de "done" sans données
+    print("🔄 Début du scraping...")
+    # [OPTIMIZATION] Pas de connexion CAS si la session Moodle est encore valide (sonde légère)
+    if not await scraper.ensure_session():
+        raise SessionExpiredError(f"Session Moodle de {username} expirée")
+    raw_courses = await scraper.get_all_courses()
+    if raw_courses is None:
+        raise RuntimeError("Liste des matières indisponible (Moodle injoignable ?)")
+
+    courses_data = []
+    unique_courses = []
+    seen_ids = set() # Pour empêcher d'ajouter deux fois la même matière
+
+    for course in raw_courses:
+        # 1. Filtre anti-doublon sur l'ID de la matière
+        c_id = str(course['id'])
+        if c_id in seen_ids:
+            continue
+        seen_ids.add(c_id)
+        unique_courses.append(course)
+
+    # [OPTIMIZATION] Récupération PARALLÈLE (limite par hôte au lieu d'un sleep fixe)
+    print(f"📚 {len(unique_courses)} matières trouvées. Lancement PARALLÈLE ({SCRAPER_CONCURRENCY} max)...")
+    emit("start", courses=len(unique_courses))
+    
+    names_by_id = {str(c['id']): c['name'] for c in unique_courses}
+    def on_course_progress(stage, course_id, grades):
+        course = {"id": str(course_id), "name": names_by_id.get(str(course_id))}
+        if stage == "parsed":
+            try:
+                average = build_course_data(course, grades)['average']
+            except Exception:
+                average = None
+            emit(stage, course_id=course["id"], name=course["name"], grades=len(grades), average=average)
+        else:
+            emit(stage, course_id=course["id"], name=course["name"])
+    
+    all_grades = await scraper.get_grades_for_courses([c['id'] for c in unique_courses], max_workers=SCRAPER_CONCURRENCY, on_progress=on_course_progress)
+
+    failed_ids = []
+    for course, grades in zip(unique_courses, all_grades):
+        if grades is None:
+            # Page non récupérée : on garde les notes déjà en base plutôt que de les vider
+            print(f"⚠️ Notes indisponibles pour {course['name']} : matière ignorée")
+            failed_ids.append(str(course['id']))
+            continue
+        try:
+            print(f"   📥 Scraping: {course['name']}...")
+            courses_data.append(build_course_data(course, grades))
+        except Exception as e:
+            print(f"⚠️ Erreur scraping grades pour {course.get('name')}: {e}")
+
+    if unique_courses and len(failed_ids) == len(unique_courses):
+        raise RuntimeError("Aucune note récupérée (toutes les matières sont en échec)")
+
+    print("✅ Scraping terminé. Synchronisation BDD...")
+
+    # --- ÉTAPE 2 : SYNCHRO DIFFÉRENTIELLE ---
+    # (les accès BDD sont bloquants : on les exécute dans le threadpool)
+    await run_in_threadpool(sync_user_courses, username, courses_data, failed_ids)
+    await run_in_threadpool(refresh_user_snapshot, username)
+    emit("synced", courses=len(courses_data), failed=len(failed_ids))
+
+# --- REFRESH JOBS ---
+# Le rafraîchissement tourne dans des workers asyncio (même boucle que les clients httpx des scrapers) ;
+# la requête HTTP ne fait qu'enregistrer un job et rend la main immédiatement.
+
+def reclaim_orphaned_jobs(c, username=None):
+    """Remet en attente les jobs 'running' dont le worker a disparu (démarrés depuis plus que la durée maximale).
+    Les jobs des autres workers encore en vie sont plus récents : ils ne sont pas repris."""
+    from datetime import datetime, timedelta
+    cutoff = (datetime.now() - timedelta(seconds=REFRESH_JOB_TIMEOUT + REFRESH_JOB_LEASE_MARGIN)).isoformat(timespec="seconds")
+    query = "UPDATE refresh_jobs SET status = 'queued', started_at = NULL WHERE status = 'running' AND (started_at IS NULL OR started_at < ?)"
+    if username is None:
+        return c.execute(query, (cutoff,)).rowcount
+    return c.execute(query + " AND username = ?", (cutoff, username)).rowcount
+
+def enqueue_refresh_job(username):
+    """Job actif de l'utilisateur s'il en existe un (dédoublonnage), sinon nouveau job : (id, créé ?)"""
+    from datetime import datetime
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        # Job resté 'running' après l'arrêt de son worker : réutilisé, mais remis en attente pour repartir
+        reclaim_orphaned_jobs(c, username)
+        # Deux requêtes simultanées peuvent toutes deux ne rien trouver : l'index unique
+        # uq_refresh_jobs_active écarte le second INSERT, qui relit alors le job du premier
+        for _ in range(3):
+            row = c.execute(f"SELECT id FROM refresh_jobs WHERE username = ? AND {ACTIVE_JOB_FILTER} ORDER BY id DESC LIMIT 1", (username,)).fetchone()
+            if row:
+                return row['id'], False
+            now = datetime.now().isoformat(timespec="seconds")
+            insert = f"""INSERT INTO refresh_jobs (username, status, created_at) VALUES (?, 'queued', ?)
+                         ON CONFLICT (username) WHERE {ACTIVE_JOB_FILTER} DO NOTHING"""
+            if conn.is_postgres:
+                row = c.execute(insert + " RETURNING id", (username, now)).fetchone()
+                if row:
+                    return row['id'], True
+            elif c.execute(insert, (username, now)).rowcount == 1:
+                return c.lastrowid, True
+        raise RuntimeError(f"Impossible d'enregistrer le rafraîchissement de {username}")
+
+def set_refresh_job_status(job_id, status, error=None):
+    from datetime import datetime
+    now = datetime.now().isoformat(timespec="seconds")
+    column = "started_at" if status == "running" else "finished_at"
+    with get_db_connection() as conn:
+        conn.cursor().execute(f"UPDATE refresh_jobs SET status = ?, error = ?, {column} = ? WHERE id = ?", (status, error, now, job_id))
+
+def claim_refresh_job(job_id):
+    """Passe le job de 'queued' à 'running' ; False s'il a déjà été pris par un autre worker"""
+    from datetime import datetime
+    now = datetime.now().isoformat(timespec="seconds")
+    with get_db_connection() as conn:
+        return conn.cursor().execute("UPDATE refresh_jobs SET status = 'running', error = NULL, started_at = ? WHERE id = ? AND status = 'queued'",
+                                     (now, job_id)).rowcount == 1
+
+def requeue_refresh_job(job_id, error):
+    """Remet en attente un job interrompu faute de session (il repart à la reconnexion de l'utilisateur)"""
+    with get_db_connection() as conn:
+        conn.cursor().execute("UPDATE refresh_jobs SET status = 'queued', error = ?, started_at = NULL WHERE id = ?", (error, job_id))
+
+def get_refresh_job(job_id, username):
+    with get_db_connection() as conn:
+        row = conn.cursor().execute("SELECT id, status, error, created_at, started_at, finished_at FROM refresh_jobs WHERE id = ? AND username = ?",
+                                    (job_id, username)).fetchone()
+    return dict(row) if row else None
+
+def pending_refresh_jobs(username=None):
+    """Jobs non terminés [(id, username)] ; un job 'running' orphelin (worker arrêté) redevient 'queued'"""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        reclaim_orphaned_jobs(c, username)
+        if username is None:
+            rows = c.execute("SELECT id, username FROM refresh_jobs WHERE status = 'queued' ORDER BY id").fetchall()
+        else:
+            rows = c.execute("SELECT id, username FROM refresh_jobs WHERE username = ? AND status = 'queued' ORDER BY id", (username,)).fetchall()
+    return [(r['id'], r['username']) for r in rows]
+
+class JobProgress:
+    """Événements de progression d'un job (historique rejoué aux abonnés SSE arrivés en retard).
+    Utilisé uniquement depuis la boucle asyncio."""
+
+    def __init__(self):
+        self.events = [] # [(type, données)]
+        self.finished = False
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, event, data):
+        self.events.append((event, data))
+        self._notify()
+
+    def finish(self, event, data):
+        self.publish(event, data)
+        self.finished = True
+        self._notify()
+
+    async def follow(self, keepalive=SSE_KEEPALIVE):
+        """Itère sur les événements jusqu'à la fin du job (None = rien de neuf depuis keepalive secondes)"""
+        seen = 0
+        while True:
+            changed = self._changed
+            while seen < len(self.events):
+                yield self.events[seen]
+                seen += 1
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+# Job en attente d'une nouvelle connexion de l'utilisateur
+SESSION_EXPIRED_MESSAGE = "Session expirée : reconnectez-vous"
+
+class RefreshQueue:
+    """Pool de workers asyncio alimenté par la table refresh_jobs (un seul job actif par utilisateur)"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self.scheduled = set() # Jobs présents dans la file ou en cours d'exécution dans ce processus
+        self.progress = OrderedDict() # { job_id: JobProgress } des derniers jobs de ce processus
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _schedule(self, job_id, username):
+        if job_id not in self.scheduled:
+            self.scheduled.add(job_id)
+            if job_id not in self.progress or self.progress[job_id].finished:
+                self.progress[job_id] = JobProgress()
+                while len(self.progress) > PROGRESS_HISTORY:
+                    self.progress.popitem(last=False)
+            self.queue.put_nowait((job_id, username))
+
+    async def submit(self, username):
+        """Enregistre (ou réutilise) le job de rafraîchissement de l'utilisateur et retourne son id"""
+        job_id, _ = await run_in_threadpool(enqueue_refresh_job, username)
+        self._schedule(job_id, username)
+        return job_id
+
+    async def recover(self, username=None):
+        """Replanifie les jobs en attente (au démarrage, ou pour un utilisateur qui vient de se reconnecter)"""
+        for job_id, job_user in await run_in_threadpool(pending_refresh_jobs, username):
+            self._schedule(job_id, job_user)
+
+    async def _worker(self):
+        while True:
+            job_id, username = await self.queue.get()
+            progress = self.progress.get(job_id)
+            try:
+                await self._run(job_id, username, progress)
+            except Exception as e:
+                print(f"❌ Job de rafraîchissement {job_id} en échec: {e}")
+                await self._fail(job_id, progress, str(e))
+            finally:
+                self.scheduled.discard(job_id)
+                self.queue.task_done()
+
+    async def _fail(self, job_id, progress, error):
+        """Marque le job en échec sans jamais lever : une BDD indisponible ne doit pas arrêter le worker"""
+        try:
+            await run_in_threadpool(set_refresh_job_status, job_id, "failed", error)
+        except Exception as e:
+            # Le job reste 'running' en base : il sera repris comme orphelin
+            print(f"⚠️ Statut du job {job_id} non enregistré: {e}")
+        try:
+            if progress is not None and not progress.finished:
+                progress.finish("failed", {"status": "failed", "error": error})
+        except Exception as e:
+            print(f"⚠️ Progression du job {job_id} non clôturée: {e}")
+
+    async def _run(self, job_id, username, progress):
+        # Session ouverte sur un autre worker : restaurée depuis la base (SESSION_BACKEND=db)
+        await active_scrapers.aget(username)
+        # Session épinglée : ni évincée ni expirée pendant le scraping
+        with active_scrapers.pinned(username) as scraper:
+            if scraper is None:
+                # Session perdue (redémarrage, expiration) : le job reste en attente et repart à la reconnexion
+                print(f"⏸️ Job {job_id} en attente : pas de session active pour {username}")
+                if progress is not None:
+                    progress.finish("queued", {"status": "queued", "error": SESSION_EXPIRED_MESSAGE})
+                return
+            # Chaque worker replanifie les jobs en attente : un seul les exécute
+            if not await run_in_threadpool(claim_refresh_job, job_id):
+                print(f"⏭️ Job {job_id} déjà pris en charge par un autre worker")
+                if progress is not None:
+                    progress.finish("running", {"status": "running"})
+                return
+            try:
+                # Durée bornée : au-delà, le job serait considéré orphelin et repris par un autre worker
+                await asyncio.wait_for(run_refresh(username, scraper, progress), REFRESH_JOB_TIMEOUT)
+                expired = False
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"Rafraîchissement interrompu après {REFRESH_JOB_TIMEOUT:.0f} s") from None
+            except SessionExpiredError as e:
+                # Pas d'échec définitif : le job attend la reconnexion (recover() au login)
+                print(f"⏸️ Job {job_id} remis en attente : {e}")
+                await run_in_threadpool(requeue_refresh_job, job_id, SESSION_EXPIRED_MESSAGE)
+                if progress is not None:
+                    progress.finish("queued", {"status": "queued", "error": SESSION_EXPIRED_MESSAGE})
+                expired = True
+        if expired:
+            await active_scrapers.discard(username) # Session morte : /refresh-ui renverra vers la connexion
+            return
+        await active_scrapers.persist(username) # Cookies éventuellement renouvelés pendant le scraping
+        await run_in_threadpool(set_refresh_job_status, job_id, "done")
+        if progress is not None:
+            progress.finish("done", {"status": "done"})
+        print(f"✅ Job de rafraîchissement {job_id} terminé pour {username}")
+
+@app.get("/refresh-ui")
+async def refresh_ui(request: Request):
+    username = request.session.get("user")
+    
+    print(f"🔄 REFRESH REQUEST for user: {username}")
+    
+    if not username or await active_scrapers.aget(username) is None:
+        print("❌ Scraper not found or user not logged in. Redirecting to login.")
+        return RedirectResponse(url="/login")
+    
+    # [OPTIMIZATION] Le scraping part en arrière-plan : la page suit l'avancement via /api/refresh/{job_id}
+    job_id = await refresh_queue.submit(username)
+    return RedirectResponse(url=f"/?job={job_id}", status_code=303)
+
+@app.get("/api/refresh/{job_id}")
+async def refresh_status(request: Request, job_id: int):
+    username = request.session.get("user")
+    if not username: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    
+    job = await run_in_threadpool(get_refresh_job, job_id, username)
+    if not job: return JSONResponse({"error": "Not found"}, status_code=404)
+    return job
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/api/refresh/{job_id}/events")
+async def refresh_events(request: Request, job_id: int):
+    """Flux Server-Sent Events : start, fetched / parsed (par matière), synced, puis done / failed / queued"""
+    username = request.session.get("user")
+    if not username: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    
+    job = await run_in_threadpool(get_refresh_job, job_id, username)
+    if not job: return JSONResponse({"error": "Not found"}, status_code=404)
+    progress = refresh_queue.progress.get(job_id)
+    
+    async def stream():
+        if progress is None:
+            # Job terminé depuis longtemps (ou exécuté par un autre processus) : juste son statut
+            yield sse_message(job['status'], job)
+            return
+        async for item in progress.follow():
+            if await request.is_disconnected():
+                return
+            yield ": ping\n\n" if item is None else sse_message(*item)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # --- API MODELS ---
 class ManualGradeRequest(BaseModel):
@@ -706,12 +1663,9 @@ async def add_manual_grade(request: Request, data: ManualGradeRequest):
     username = request.session.get("user")
     if not username: return JSONResponse({"error": "Unauthorized"}, status_code=401)
     
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("INSERT INTO manual_grades (username, course_canonical_name, name, grade, max_grade, coef) VALUES (?, ?, ?, ?, ?, ?)",
-              (username, data.course_name, data.grade_name, data.grade_value, data.max_value, data.coef))
-    conn.commit()
-    conn.close()
+    await run_in_threadpool(apply_user_change, username,
+                            "INSERT INTO manual_grades (username, course_canonical_name, name, grade, max_grade, coef) VALUES (?, ?, ?, ?, ?, ?)",
+                            (username, data.course_name, data.grade_name, data.grade_value, data.max_value, data.coef))
     return {"status": "ok"}
 
 @app.post("/api/manual-grade/delete")
@@ -719,11 +1673,8 @@ async def delete_manual_grade(request: Request, data: DeleteGradeRequest):
     username = request.session.get("user")
     if not username: return JSONResponse({"error": "Unauthorized"}, status_code=401)
     
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM manual_grades WHERE id = ? AND username = ?", (data.grade_id, username))
-    conn.commit()
-    conn.close()
+    await run_in_threadpool(apply_user_change, username,
+                            "DELETE FROM manual_grades WHERE id = ? AND username = ?", (data.grade_id, username))
     return {"status": "ok"}
 
 @app.post("/api/grade/exclude")
@@ -731,8 +1682,6 @@ async def exclude_grade(request: Request, data: ExcludeGradeRequest):
     username = request.session.get("user")
     if not username: return JSONResponse({"error": "Unauthorized"}, status_code=401)
     
-    conn = get_db_connection()
-    c = conn.cursor()
     # On ajoute à la liste des exclusions
     # On nettoie le nom (enlève l'icone si présent par erreur, même si le front l'envoie propre normalement)
     clean_name = data.grade_name.replace("📝 ", "")
@@ -740,10 +1689,9 @@ async def exclude_grade(request: Request, data: ExcludeGradeRequest):
     # [MAPPING_HELPER] Log pour récupérer les règles plus tard
     print(f"[MAPPING_HELPER] EXCLUDE | Course: '{data.course_name}' | Grade: '{clean_name}' | Value: {data.grade_value}")
     
-    c.execute("INSERT INTO grade_exclusions (username, course_canonical_name, grade_name, grade_value) VALUES (?, ?, ?, ?)",
-              (username, data.course_name, clean_name, data.grade_value))
-    conn.commit()
-    conn.close()
+    await run_in_threadpool(apply_user_change, username,
+                            "INSERT INTO grade_exclusions (username, course_canonical_name, grade_name, grade_value) VALUES (?, ?, ?, ?)",
+                            (username, data.course_name, clean_name, data.grade_value))
     return {"status": "ok"}
 
 @app.post("/api/course/customize")
@@ -754,17 +1702,13 @@ async def customize_course(request: Request, data: CustomCourseRequest):
     # [MAPPING_HELPER] Log pour récupérer les règles plus tard
     print(f"[MAPPING_HELPER] MOVE/CUSTOMIZE | Course: '{data.course_name}' | Target UE: '{data.target_competence}' | Coef: {data.custom_coef}")
     
-    conn = get_db_connection()
-    c = conn.cursor()
     # Upsert logic
-    c.execute("""
+    await run_in_threadpool(apply_user_change, username, """
         INSERT INTO course_overrides (username, course_canonical_name, target_competence, custom_coef) 
         VALUES (?, ?, ?, ?)
         ON CONFLICT(username, course_canonical_name) 
         DO UPDATE SET target_competence=excluded.target_competence, custom_coef=excluded.custom_coef
     """, (username, data.course_name, data.target_competence, data.custom_coef))
-    conn.commit()
-    conn.close()
     return {"status": "ok"}
 
 # [FEATURE] Endpoint for Grade Editing (Rename/Move)
@@ -776,22 +1720,16 @@ async def edit_grade(request: Request, data: EditGradeRequest):
     # [MAPPING_HELPER]
     print(f"[MAPPING_HELPER] EDIT_GRADE | Course: '{data.course_name}' | Grade: '{data.grade_name}' | NewName: '{data.new_name}' | Target: '{data.target_course_name}'")
 
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    c.execute("""
+    await run_in_threadpool(apply_user_change, username, """
         INSERT INTO grade_overrides (username, course_canonical_name, grade_name, new_name, target_course_id)
         VALUES (?, ?, ?, ?, ?)
         ON CONFLICT(username, course_canonical_name, grade_name)
         DO UPDATE SET new_name=excluded.new_name, target_course_id=excluded.target_course_id
     """, (username, data.course_name, data.grade_name, data.new_name, data.target_course_name))
-    
-    conn.commit()
-    conn.close()
     return {"status": "ok"}
 
 @app.post("/api/admin/export-maquette")
-async def export_maquette(request: Request):
+def export_maquette(request: Request): # Synchrone : exécuté dans le pool de threads (attente de connexion, calcul)
     username = request.session.get("user")
     if not username: return JSONResponse({"error": "Unauthorized"}, status_code=401)
     
@@ -805,42 +1743,12 @@ async def export_maquette(request: Request):
     status = settings['status'] if settings else 'Etudiant'
     
     # Fetch Data for Calculation
-    courses_rows = c.execute("SELECT * FROM courses WHERE username = ?", (username,)).fetchall()
-    grades_rows = c.execute("SELECT * FROM grades WHERE username = ?", (username,)).fetchall()
-    manual_grades_rows = c.execute("SELECT * FROM manual_grades WHERE username = ?", (username,)).fetchall()
-    
-    overrides_rows = c.execute("SELECT * FROM course_overrides WHERE username = ?", (username,)).fetchall()
-    grade_overrides_rows = c.execute("SELECT * FROM grade_overrides WHERE username = ?", (username,)).fetchall()
-    exclusions_rows = c.execute("SELECT * FROM grade_exclusions WHERE username = ?", (username,)).fetchall()
+    user_data = load_user_data(c, username)
 
     conn.close()
 
-    # Convert to Dicts/Lists
-    # We need to nest grades into courses to match calculate_semester_stats signature
-    manual_grades = [dict(r) for r in manual_grades_rows]
-    overrides_map = {r['course_canonical_name']: dict(r) for r in overrides_rows}
-    grade_overrides_map = {(r['course_canonical_name'], r['grade_name']): dict(r) for r in grade_overrides_rows}
-    # exclusions_rows is passed directly
-    
-    # helper for nesting
-    grades_by_course = {}
-    for g in grades_rows:
-        g_dict = dict(g)
-        cid = g_dict['course_id']
-        if cid not in grades_by_course: grades_by_course[cid] = []
-        grades_by_course[cid].append(g_dict)
-        
-    courses_list = []
-    for r in courses_rows:
-        c_dict = dict(r)
-        c_dict['grades'] = grades_by_course.get(c_dict['id'], [])
-        courses_list.append(c_dict)
-
     # Calculate Stats (Gives us the final structure)
-    stats = calculate_semester_stats(
-        courses_list, manual_grades, overrides_map, grade_overrides_map, exclusions_rows,
-        semester, option, status
-    )
+    stats = stats_for(user_data, semester, option, status)
     
     # Log to Console
     print(f"\n{'='*20} START MAQUETTE EXPORT ({semester}) {'='*20}")
@@ -853,9 +1761,9 @@ async def export_maquette(request: Request):
                 c_orig = course.get('original_name', 'N/A')
                 print(f"[MAQUETTE_EXPORT]   Course: {c_name} (Original: {c_orig})")
                 for grade in course['grades']:
-                    g_name = grade['name']
-                    g_val = grade['grade']
-                    g_max = grade['max_grade']
+                    g_name = grade.name
+                    g_val = grade.grade
+                    g_max = grade.max_grade
                     print(f"[MAQUETTE_EXPORT]     - Grade: {g_name} : {g_val}/{g_max}")
     else:
         print("[MAQUETTE_EXPORT] No data found or calculation error.")
@@ -864,6 +1772,13 @@ async def export_maquette(request: Request):
     
     return {"status": "ok", "message": "Maquette exported to server logs"}
 
+@app.get("/api/admin/stats")
+async def admin_stats(request: Request):
+    """Statistiques des caches en mémoire (sessions scraper, moyennes)"""
+    username = request.session.get("user")
+    if username != "pesthor": return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return {"scrapers": active_scrapers.stats(), "stats_cache": stats_cache.stats()}
+
 @app.post("/save-config")
 def save_config(request: Request, semester: str = Form(...), option: str = Form(...), status: str = Form(...)):
     username = request.session.get("user")
@@ -876,125 +1791,17 @@ def save_config(request: Request, semester: str = Form(...), option: str = Form(
         INSERT INTO user_settings (username, semester, option, status) VALUES (?, ?, ?, ?)
         ON CONFLICT(username) DO UPDATE SET semester=excluded.semester, option=excluded.option, status=excluded.status
     """, (username, semester, option, status))
+    bump_data_version(c, username)
     conn.commit()
     conn.close()
+    refresh_user_snapshot(username)
     
     return RedirectResponse(url="/", status_code=303)
 
 def find_best_match(scraped_name, canonical_names, teacher_map=None):
-    """Trouve le nom canonique le plus proche avec heuristiques intelligentes"""
-    clean_scraped = scraped_name.lower().strip()
-    
-    # 1. Overrides Manuels (Basés sur les logs & FIX pour 'ibazizou', 'alie', etc.)
-    manual_map = {
-        # --- Compétence 4 & Stats ---
-        "ibazizou": "SAÉ - Description et prévision de données temporelles",
-        "alie": "SAÉ - Description et prévision de données temporelles",
-        "temporelles": "SAÉ - Description et prévision de données temporelles",
-        "cookie": "SAÉ - EMS - Recueil et analyse de données par échantillonnage ou plan d'expérience",
-        "recueil": "SAÉ - EMS - Recueil et analyse de données par échantillonnage ou plan d'expérience",
-        "devoirdépôt": "EMS - Techniques de sondage et méthologie de l'enquête",
-        "mise en place d'une enquête": "EMS - Techniques de sondage et méthologie de l'enquête",
-        "prou": "EMS - Techniques de sondage et méthologie de l'enquête",
-        "canari": "AL - Régression linéaire simple",
-
-        # --- Eco / Gestion ---
-        "gestion": "Les données de l’environnement entrepreneurial et économique pour l’aide à la décision",
-        "economie": "Les données de l’environnement entrepreneurial et économique pour l’aide à la décision",
-        "entrepreneuriat": "Les données de l’environnement entrepreneurial et économique pour l’aide à la décision",
-
-        # --- Anglais & Com ---
-        "writing": "Anglais professionnel",
-        "anglais": "Anglais professionnel",
-        "expression orale": "Anglais professionnel",
-        "bieber": "Communication organisationnelle et professionnelle",
-        "scénario": "Communication organisationnelle et professionnelle",
-        "communication": "Communication organisationnelle et professionnelle",
-
-        # --- Informatique / SID ---
-        "architecture sid": "Systèmes d'information décisionnels",
-        "testqcm": "Systèmes d'information décisionnels",
-        "sid": "Systèmes d'information décisionnels",
-        "sas": "Programmation statistique automatisée",
-        "poo": "EMS - AL -  Programmation objet",
-        "web": "Technologies web",
-        
-        # --- Conformité ---
-        "conformité": "SAÉ - EMS - Conformité réglementaire pour analyser des données",
-        "règlementaire": "SAÉ - EMS - Conformité réglementaire pour analyser des données"
-    }
-    
-    for key, target in manual_map.items():
-        if key in clean_scraped:
-            return target
-
-    # 2. Correspondance par Enseignant (TRÈS FIABLE)
-    if teacher_map:
-        for c_name, teacher in teacher_map.items():
-            if not teacher or len(teacher) < 3: continue
-            
-            # On cherche si le nom du prof (ex: "Goumeziane") est dans le nom scrapé
-            # On découpe "M. Gouméziane" -> "Gouméziane"
-            parts = teacher.replace("M.", "").replace("Mme", "").split()
-            for part in parts:
-                if len(part) > 3 and part.lower() in clean_scraped:
-                    # BINGO
-                    return c_name
-
-    # 3. Correspondance par Mots-clés Canoniqes (Dictionnaire Inversé)
-    # On éclate chaque nom canonique en mots-clés significatifs
-    # Ex: "Systèmes d'information décisionnels" -> ["systèmes", "information", "décisionnels", "architecture"]
-    
-    best_score = 0
-    best_candidate = None
-    
-    # Mots vides à ignorer
-    stopwords = ["de", "des", "le", "la", "les", "un", "une", "et", "à", "pour", "en", "d'", "l'", "s3", "s4", "but", "but2", "cours", "td", "tp"]
-    
-    # On regarde si le semestre est dans le nom (Ex: "S3 - ...")
-    # Si oui, on booste le score
-    semester_boost = False
-    if "s3" in clean_scraped or "s4" in clean_scraped:
-         semester_boost = True
-
-    for canonical in canonical_names:
-        score = 0
-        clean_canonical = canonical.lower()
-        
-        # Mots clés du canonique
-        keywords = [w for w in re.split(r'\W+', clean_canonical) if len(w) > 2 and w not in stopwords]
-        
-        # Mots clés du scrapé
-        scraped_words = [w for w in re.split(r'\W+', clean_scraped) if len(w) > 2 and w not in stopwords]
-        
-        for k in keywords:
-            # Si le mot clé est dans le nom scrapé (même partiel)
-            if k in clean_scraped:
-                 score += 2
-                 
-            # Correspondance exacte mot à mot
-            if k in scraped_words:
-                score += 1
-        
-        # Bonus si startswith
-        if clean_scraped.startswith(clean_canonical[:10]):
-            score += 3
-            
-        if score > best_score:
-            best_score = score
-            best_candidate = canonical
-            
-    if best_score >= 2: # Seuil minimum de pertinence
-        return best_candidate
-
-    # 4. Fallback Fuzzy Match (Dernier recours)
-    matches = get_close_matches(clean_scraped, [n.lower() for n in canonical_names], n=1, cutoff=0.4)
-    if matches:
-        for name in canonical_names:
-            if name.lower() == matches[0]:
-                return name
-                
-    return None
+    """Trouve le nom canonique le plus proche avec heuristiques intelligentes
+    (compatibilité scripts : les routes utilisent le CourseMatcher en cache de la maquette)"""
+    return CourseMatcher(canonical_names, teacher_map).match(scraped_name)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,13 +1,41 @@
 import csv
+import hashlib
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from course_matcher import CourseMatcher, load_aliases
 
 MAQUETTE_DIR = "maquettes"
 
+# Délai (secondes) pendant lequel une maquette en cache est servie sans aucun accès disque.
+# Passé ce délai, on vérifie la date de modification (mtime) des CSV avant de la resservir.
+MAQUETTE_CHECK_INTERVAL = float(os.getenv("MAQUETTE_CHECK_INTERVAL", "30"))
+
 class MaquetteService:
     def __init__(self):
-        self.coefficients = {} # { (semester, option, status): { course_name: { comp_name: coef } } }
-        self.courses_metadata = {} # { semester: [course_names...] }
+        self.coefficients = {} # { (semester, option, status): { "data": maquette, "signature": ..., "checked_at": ... } }
+        self.courses_metadata = {} # { struct_path: { "teachers": {course: teacher}, "mtime": ... } }
+        self._locks = {} # Un verrou par maquette : les parsings de maquettes différentes restent parallèles
+        self.catalog = MappingProxyType({}) # Maquettes préchargées au démarrage (lecture seule)
+
+    def _find_file(self, filename_part):
+        """Chemin du premier fichier de MAQUETTE_DIR contenant filename_part (ou None)"""
+        matching_files = [f for f in os.listdir(MAQUETTE_DIR) if filename_part in f]
+        if not matching_files:
+            return None
+        return os.path.join(MAQUETTE_DIR, matching_files[0])
+
+    def _signature(self, semester, option, status):
+        """(chemin, mtime) des deux CSV utilisés pour une maquette : change si un fichier est modifié/remplacé"""
+        coef_path = self._find_file(f"Coef - BUT2 - {option} - {status}")
+        struct_path = self._find_file(f"Niort - Cours {semester}")
+        return tuple(
+            (path, os.path.getmtime(path) if path else None)
+            for path in (coef_path, struct_path)
+        )
 
     def load_maquette(self, semester, option, status):
         """
@@ -18,32 +46,130 @@ class MaquetteService:
                 "Nom Matière": { "Compétence 1": 10, "Compétence 2": 0, ... }
             }
         }
+        Le résultat est mis en cache (partagé : ne pas le modifier).
         """
+        key = (semester, option, status)
+        entry = self.coefficients.get(key)
+        
+        # [OPTIMIZATION] Cache chaud : aucun accès disque ni parsing
+        if entry and time.monotonic() - entry["checked_at"] < MAQUETTE_CHECK_INTERVAL:
+            return entry["data"]
+        
+        with self._locks.setdefault(key, threading.Lock()):
+            signature = self._signature(semester, option, status)
+            entry = self.coefficients.get(key)
+            if entry and entry["signature"] == signature:
+                entry["checked_at"] = time.monotonic()
+                return entry["data"]
+            
+            data = self._build_maquette(semester, option, status, signature)
+            if data is not None:
+                self.coefficients[key] = {"data": data, "signature": signature, "checked_at": time.monotonic()}
+            return data
+
+    def get_matcher(self, semester, option, status):
+        """CourseMatcher de la maquette (construit une seule fois par version de maquette)"""
+        data = self.load_maquette(semester, option, status)
+        if data is None:
+            return None
+        entry = self.coefficients[(semester, option, status)]
+        matcher = entry.get("matcher")
+        # Reconstruit aussi si la table d'alias a changé depuis
+        if matcher is None or matcher.aliases is not load_aliases():
+            matcher = CourseMatcher(list(data['courses'].keys()), data.get('teachers', {}))
+            entry["matcher"] = matcher
+        return matcher
+
+    def fingerprint(self, semester, option, status):
+        """Empreinte de la maquette en service (CSV + matcher) : change dès qu'un calcul fait avec elle peut changer"""
+        matcher = self.get_matcher(semester, option, status)
+        if matcher is None:
+            return None
+        signature = self.coefficients[(semester, option, status)]["signature"]
+        return hashlib.sha1(repr((signature, matcher.identity)).encode('utf-8')).hexdigest()
+
+    def discover(self):
+        """Liste les combinaisons (semestre, option, statut) disponibles dans MAQUETTE_DIR"""
+        files = os.listdir(MAQUETTE_DIR)
+        formations = sorted({
+            (m.group(1).strip(), m.group(2).strip())
+            for m in (re.search(r"Coef - BUT2 - ([^-()]+) - ([^-()]+)\)", f) for f in files) if m
+        })
+        semesters = sorted({m.group(1) for m in (re.search(r"Niort - Cours (S\d)", f) for f in files) if m})
+        return [(sem, option, status) for sem in semesters for option, status in formations]
+
+    def validate(self, key, maquette):
+        """Retourne la liste des problèmes détectés dans une maquette (vide si OK)"""
+        semester, option, status = key
+        if maquette is None:
+            return [f"aucun fichier 'Coef - BUT2 - {option} - {status}'"]
+        errors = []
+        if not maquette['competences']:
+            errors.append(f"aucune compétence trouvée pour le semestre {semester}")
+        if not maquette['courses']:
+            errors.append(f"aucune matière avec coefficient pour le semestre {semester}")
+        for c_name, coefs in maquette['courses'].items():
+            unknown = [comp for comp in coefs if comp not in maquette['competences']]
+            if unknown:
+                errors.append(f"'{c_name}' référence des compétences inconnues: {unknown}")
+        if not maquette.get('teachers'):
+            errors.append(f"aucun enseignant trouvé (fichier 'Niort - Cours {semester}')")
+        return errors
+
+    def preload(self, max_workers=4):
+        """Parse et valide toutes les maquettes en parallèle, puis expose le résultat dans self.catalog"""
+        keys = self.discover()
+        start = time.perf_counter()
+
+        def load(key):
+            t0 = time.perf_counter()
+            try:
+                maquette = self.load_maquette(*key)
+                errors = self.validate(key, maquette)
+            except Exception as e:
+                maquette, errors = None, [f"exception: {e}"]
+            return key, maquette, errors, (time.perf_counter() - t0) * 1000
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            results = list(pool.map(load, keys))
+
+        loaded = {}
+        for key, maquette, errors, elapsed in results:
+            label = " / ".join(key)
+            if maquette is not None:
+                loaded[key] = maquette
+            if errors:
+                print(f"⚠️ Maquette {label} ({elapsed:.0f} ms): " + " ; ".join(errors))
+            else:
+                print(f"✅ Maquette {label}: {len(maquette['courses'])} matières, {len(maquette['competences'])} compétences ({elapsed:.0f} ms)")
+
+        self.catalog = MappingProxyType(loaded)
+        total = (time.perf_counter() - start) * 1000
+        print(f"📚 {len(loaded)}/{len(keys)} maquettes préchargées en {total:.0f} ms")
+        return results
+
+    def _build_maquette(self, semester, option, status, signature):
         # Construction du nom de fichier
         # Format: "Maquette - MCCC - 2025-2026 - Version étudiant(Coef - BUT2 - EMS - FI).csv"
         # Semester S3/S4 est implicite dans le BUT2 ? Non, le fichier contient S3 ET S4.
+        (filepath, _), (struct_path, struct_mtime) = signature
         
-        filename_part = f"Coef - BUT2 - {option} - {status}"
-        matching_files = [f for f in os.listdir(MAQUETTE_DIR) if filename_part in f]
-        
-        if not matching_files:
+        if not filepath:
             print(f"❌ Aucune maquette trouvée pour {option} / {status}")
             return None
         
-        filepath = os.path.join(MAQUETTE_DIR, matching_files[0])
-        
         # 1. Parsing des Coefficients (Fichier EMS/VCOD - FI/FA)
         data = self._parse_coef_csv(filepath, semester)
         
         # 2. Parsing de la Structure (Fichier Cours S3 / S4) pour les enseignants
-        # Recheche fichier "Niort - Cours S3/S4"
-        struct_file_part = f"Niort - Cours {semester}"
-        struct_files = [f for f in os.listdir(MAQUETTE_DIR) if struct_file_part in f]
-        
+        # Recheche fichier "Niort - Cours S3/S4" (partagé entre options/statuts : mis en cache à part)
         teacher_map = {} # { "Nom Matière": "M.Prof" }
-        if struct_files:
-            struct_path = os.path.join(MAQUETTE_DIR, struct_files[0])
-            teacher_map = self._parse_structure_csv(struct_path)
+        if struct_path:
+            cached = self.courses_metadata.get(struct_path)
+            if not cached or cached["mtime"] != struct_mtime:
+                cached = {"teachers": self._parse_structure_csv(struct_path), "mtime": struct_mtime}
+                self.courses_metadata[struct_path] = cached
+            teacher_map = cached["teachers"]
             
         # Fusion des infos : on ajoute le teacher dans data['courses'] pour l'utiliser plus tard
         for c_name, c_info in data['courses'].items():
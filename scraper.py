@@ -1,188 +1,439 @@
-import requests
+import httpx
+import asyncio
 from bs4 import BeautifulSoup
 import re
+import os
+import time
+from http.cookiejar import Cookie
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse, urljoin
 
-class MoodleScraper:
-    def __init__(self, username, password):
+# [OPTIMIZATION] Scraping parallèle des notes (configurable par variables d'environnement)
+# SCRAPER_CONCURRENCY : nombre de matières récupérées en même temps
+# SCRAPER_PER_HOST    : nombre max de requêtes simultanées vers un même hôte (politesse envers Moodle)
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "8"))
+SCRAPER_PER_HOST = int(os.getenv("SCRAPER_PER_HOST", "4"))
+POOL_SIZE = 50
+# Sonde de validité de la session Moodle (HEAD /my/) au plus une fois par intervalle (s)
+SESSION_CHECK_INTERVAL = float(os.getenv("SESSION_CHECK_INTERVAL", "300"))
+
+CAS_URL = "https://auth.univ-poitiers.fr/cas/login?service=https%3A%2F%2Fupdago.univ-poitiers.fr%2Flogin%2Findex.php%3FauthCAS%3DCAS"
+MOODLE_HOST = "updago.univ-poitiers.fr"
+CAS_HOST = "auth.univ-poitiers.fr"
+MY_URL = "https://updago.univ-poitiers.fr/my/"
+OVERVIEW_URL = "https://updago.univ-poitiers.fr/grade/report/overview/index.php"
+GRADES_URL = "https://updago.univ-poitiers.fr/course/user.php?mode=grade&id={course_id}&user={user_id}"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# Filtre anti-bruit (Annuaires, Pôles, etc.)
+COURSE_BLACKLIST = [
+    "ENSIP", "IAE", "IPAG", "IUT16", "IUT86",
+    "Obtenir l’app mobile", "Scolarité", "Intranet", "Bibliothèque",
+    "INSPE", "UFR", "Faculté", "Lettres et Langues", "Maison des Langues",
+    "SAFIRE", "Services transverses", "UEO", "Auto-formation"
+]
+
+# --- PARSING HTML (fonctions pures, exécutées hors de la boucle via asyncio.to_thread) ---
+
+def parse_execution_token(html):
+    """Extrait le jeton 'execution' du formulaire CAS (None si absent)"""
+    soup = BeautifulSoup(html, 'html.parser')
+    token_input = soup.find('input', {'name': 'execution'})
+    if not token_input:
+        return None
+    return token_input['value']
+
+def parse_user_id(html):
+    """Extrait l'ID utilisateur Moodle depuis la page d'accueil/profil"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Recherche du lien de profil dans le menu utilisateur ou ailleurs
+    # Souvent de la forme: https://updago.univ-poitiers.fr/user/profile.php?id=XXXX
+    profile_link = soup.find('a', href=re.compile(r'user/profile\.php\?id=\d+'))
+
+    if profile_link:
+        match = re.search(r'id=(\d+)', profile_link['href'])
+        if match:
+            return match.group(1)
+    return None
+
+def parse_courses(html, user_id=None):
+    """Extrait la liste des matières de la page de synthèse des notes"""
+    soup = BeautifulSoup(html, 'html.parser')
+    courses = []
+    seen_ids = set()
+
+    for link in soup.find_all('a', href=True):
+        match = re.search(r'id=(\d+)', link['href'])
+        if match and link.text.strip():
+            c_id = match.group(1)
+            c_name = link.text.strip()
+
+            if any(bad in c_name for bad in COURSE_BLACKLIST):
+                continue
+
+            if int(c_id) > 100 and c_id != user_id and c_id not in seen_ids:
+                courses.append({"id": c_id, "name": c_name})
+                seen_ids.add(c_id)
+    return courses
+
+def parse_grades(html):
+    """Extrait les notes d'une page 'user report' Moodle (Version Robuste)"""
+    soup = BeautifulSoup(html, 'html.parser')
+    grades = []
+
+    # On cherche table avec user-grade OU generaltable (parfois l'un, parfois l'autre)
+    table = soup.find('table', class_='user-grade') or soup.find('table', class_='generaltable')
+
+    if not table:
+        # DEBUG: Si pas de table, on log l'URL pour vérifier manuellement si besoin
+        # print(f"⚠️ Pas de table trouvée pour {course_id}")
+        return []
+
+    for row in table.find_all('tr'):
+        # Protection si la ligne est vide
+        if not row.find('td'): continue
+
+        name_cell = row.find(class_='column-itemname')
+        grade_cell = row.find(class_='column-grade')
+        range_cell = row.find(class_='column-range')
+
+        if name_cell and grade_cell:
+            raw_text_name = name_cell.text.strip()
+            raw_grade = grade_cell.text.strip()
+
+            if raw_grade in ["-", "", "Empty"]: continue
+            if "tendance" in raw_text_name.lower(): continue
+
+            try:
+                # Nettoyage de la note
+                clean_grade = float(raw_grade.replace(',', '.').split()[0])
+            except ValueError:
+                continue
+
+            max_grade = 20.0
+            if range_cell:
+                try:
+                    # Gestion robuste du range "0–20" ou "0-100"
+                    txt_range = range_cell.text.replace("–", "-").strip()
+                    parts = txt_range.split("-")
+                    if len(parts) >= 2:
+                        max_grade = float(parts[-1].strip())
+                except:
+                    pass # On garde 20.0 par défaut
+
+            is_total = "Total" in raw_text_name or "Moyenne" in raw_text_name
+
+            grades.append({
+                "name": raw_text_name.replace("Élément manuel", "").strip(),
+                "grade": clean_grade,
+                "max_grade": max_grade,
+                "is_total": is_total
+            })
+    return grades
+
+def on_moodle(url):
+    """URL servie par Moodle (l'URL du CAS contient aussi MOODLE_HOST, dans son paramètre service)"""
+    return urlparse(str(url)).netloc == MOODLE_HOST
+
+def is_login_url(url):
+    """Page du CAS ou de connexion Moodle : la session Moodle a expiré"""
+    parts = urlparse(str(url))
+    return parts.netloc == CAS_HOST or (parts.netloc == MOODLE_HOST and parts.path.startswith("/login/"))
+
+class SessionExpiredError(Exception):
+    """Session Moodle expirée et reconnexion automatique impossible (mot de passe non conservé, identifiants refusés)"""
+
+class MoodleUnavailableError(Exception):
+    """Moodle ou le CAS injoignable (erreur réseau, erreur 5xx) : la session n'est pas en cause"""
+
+# --- PERSISTANCE DES COOKIES (session reprise par un autre processus) ---
+
+def dump_cookies(jar):
+    """Cookies d'un CookieJar -> liste JSON-sérialisable"""
+    return [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path, "secure": c.secure, "expires": c.expires}
+            for c in jar]
+
+def load_cookies(jar, items):
+    """Recharge dans un CookieJar les cookies produits par dump_cookies()"""
+    for item in items:
+        domain = item["domain"]
+        jar.set_cookie(Cookie(
+            version=0, name=item["name"], value=item["value"], port=None, port_specified=False,
+            domain=domain, domain_specified=bool(domain), domain_initial_dot=domain.startswith("."),
+            path=item["path"], path_specified=True, secure=item["secure"], expires=item["expires"],
+            discard=item["expires"] is None, comment=None, comment_url=None, rest={},
+        ))
+
+def _login_payload(username, password, token):
+    return {
+        'username': username,
+        'password': password,
+        'execution': token,
+        '_eventId': 'submit',
+        'geolocation': '',
+        'deviceFingerprint': ''
+    }
+
+class AsyncMoodleScraper:
+    """Scraper Moodle asyncio (client httpx partagé, méthodes à 'await').
+    Seule implémentation : l'ancienne version synchrone (requests + threads) a été retirée."""
+
+    def __init__(self, username, password, user_id=None):
         self.username = username
         self.password = password
-        # L'ID sera récupéré après connexion
-        self.user_id = None 
-        
-        # Session pour garder les cookies
-        self.session = requests.Session()
-        
-        # [OPTIMIZATION] Increase Pool Size for Parallel Requests
-        adapter = requests.adapters.HTTPAdapter(pool_connections=50, pool_maxsize=50)
-        self.session.mount("https://", adapter)
-        self.session.mount("http://", adapter)
-
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        })
+        # ID Moodle : connu d'une connexion précédente, sinon récupéré après connexion
+        self.user_id = user_id
+
+        # Client async pour garder les cookies (pool de POOL_SIZE connexions)
+        self.client = httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            follow_redirects=True,
+            timeout=30,
+        )
         self.is_connected = False
 
-    def login(self):
-        """Gère la connexion CAS"""
-        print(f"🔌 Tentative de connexion pour {self.username}...")
-        cas_url = "https://auth.univ-poitiers.fr/cas/login?service=https%3A%2F%2Fupdago.univ-poitiers.fr%2Flogin%2Findex.php%3FauthCAS%3DCAS"
-        
-        try:
-            r_get = self.session.get(cas_url, timeout=30)
-            soup = BeautifulSoup(r_get.text, 'html.parser')
-            
-            token_input = soup.find('input', {'name': 'execution'})
-            if not token_input:
+        # Un sémaphore par hôte pour limiter les requêtes simultanées
+        self._host_slots = {}
+
+        # Reconnexion unique quand plusieurs requêtes en vol tombent sur le CAS en même temps
+        self._login_lock = asyncio.Lock()
+        self._generation = 0 # Incrémenté à chaque tentative de connexion
+        self._login_failed = False # Dernière tentative échouée : pas de nouvel essai automatique
+        self._unreachable = False # Dernière tentative interrompue par une panne (réseau, CAS en erreur)
+        self._checked_at = 0.0 # Dernière réponse Moodle authentifiée (time.monotonic)
+
+    @asynccontextmanager
+    async def _host_slot(self, url):
+        """Réserve une place parmi les SCRAPER_PER_HOST requêtes autorisées vers l'hôte de l'URL"""
+        host = urlparse(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = asyncio.Semaphore(max(1, SCRAPER_PER_HOST))
+            self._host_slots[host] = slot
+        async with slot:
+            yield
+
+    async def _get(self, url):
+        """GET via le client partagé, en respectant la limite par hôte"""
+        async with self._host_slot(url):
+            return await self.client.get(url)
+
+    async def _fetch(self, url, limited=True):
+        """GET authentifié : sur une redirection vers le CAS, reconnexion transparente puis un seul nouvel essai.
+        Lève SessionExpiredError plutôt que de renvoyer la page de connexion."""
+        generation = self._generation
+        get = self._get if limited else self.client.get
+        r = await get(url)
+        if not is_login_url(r.url):
+            self._checked_at = time.monotonic()
+            return r
+        if await self._relogin(generation):
+            r = await get(url)
+            if not is_login_url(r.url):
+                self._checked_at = time.monotonic()
+                return r
+        raise SessionExpiredError(f"Session Moodle de {self.username} expirée")
+
+    async def _relogin(self, generation, force=False):
+        """Reconnexion, une seule fois pour toutes les requêtes ayant constaté l'expiration de la même session
+        (après un échec, seul un appel explicite, force=True, retente la connexion)"""
+        async with self._login_lock:
+            if self._generation != generation:
+                # Déjà tentée par une autre requête
+                if self._unreachable:
+                    raise MoodleUnavailableError("CAS injoignable pendant la reconnexion")
+                return self.is_connected
+            if self._login_failed and not force:
                 return False
-            
-            token = token_input['value']
-            
-            payload = {
-                'username': self.username,
-                'password': self.password,
-                'execution': token,
-                '_eventId': 'submit',
-                'geolocation': '',
-                'deviceFingerprint': ''
-            }
-            
-            r_post = self.session.post(cas_url, data=payload, allow_redirects=True, timeout=30)
-            
-            if "updago.univ-poitiers.fr" in r_post.url:
-                self.is_connected = True
-                self.retrieve_user_id()  # Retrieve ID immediately after login
+            if self.is_connected:
+                print(f"🔁 Session Moodle de {self.username} expirée : reconnexion")
+            self.is_connected = False
+            return await self._authenticate()
+
+    async def check_session(self):
+        """Sonde légère : HEAD /my/ sans suivre les redirections (renvoi vers la connexion = session expirée).
+        Une erreur réseau lève MoodleUnavailableError : elle ne dit rien de la session."""
+        try:
+            r = await self.client.head(MY_URL, follow_redirects=False)
+        except httpx.HTTPError as e:
+            print(f"❌ Erreur réseau (sonde de session) : {e}")
+            raise MoodleUnavailableError(f"Moodle injoignable : {e}") from e
+        valid = not (r.is_redirect and is_login_url(urljoin(MY_URL, r.headers.get("location", ""))))
+        if valid:
+            self._checked_at = time.monotonic()
+        return valid
+
+    async def ensure_session(self):
+        """Connexion CAS seulement si nécessaire : session vérifiée récemment, sinon sondée avant de se reconnecter.
+        False = session refusée (reconnexion impossible) ; MoodleUnavailableError = panne, session conservée."""
+        if self.is_connected:
+            if time.monotonic() - self._checked_at < SESSION_CHECK_INTERVAL or await self.check_session():
                 return True
+        return await self._relogin(self._generation, force=True)
+
+    def export_state(self):
+        """État réutilisable par un autre processus : cookies (Moodle + CAS) et ID, jamais le mot de passe"""
+        return {"user_id": self.user_id, "cookies": dump_cookies(self.client.cookies.jar)}
+
+    @classmethod
+    def from_state(cls, username, state):
+        """Scraper reconstruit depuis export_state(), sans nouvelle connexion CAS"""
+        scraper = cls(username, None, state.get("user_id"))
+        load_cookies(scraper.client.cookies.jar, state.get("cookies", []))
+        scraper.is_connected = bool(scraper.user_id) # Validité vérifiée par ensure_session() avant usage
+        return scraper
+
+    async def login(self):
+        """Gère la connexion CAS (False en cas d'échec, panne comprise)"""
+        try:
+            return await self._authenticate()
+        except MoodleUnavailableError:
             return False
-                
-        except Exception as e:
+
+    async def _authenticate(self):
+        """Connexion CAS : True/False selon la réponse du CAS, MoodleUnavailableError s'il n'a pas pu répondre"""
+        print(f"🔌 Tentative de connexion (async) pour {self.username}...")
+
+        unreachable = False
+        try:
+            r_get = await self.client.get(CAS_URL)
+            if r_get.status_code >= 500:
+                raise MoodleUnavailableError(f"CAS en erreur (HTTP {r_get.status_code})")
+            if on_moodle(r_get.url):
+                # Ticket CAS encore valide : renvoi direct vers Moodle, sans identifiants
+                return await self._logged_in()
+            if self.password is None:
+                # Session restaurée (from_state) : le mot de passe n'est pas conservé
+                print(f"⚠️ Session de {self.username} expirée : reconnexion nécessaire")
+                return False
+
+            # Le parsing BeautifulSoup est bloquant : on le sort de la boucle d'événements
+            token = await asyncio.to_thread(parse_execution_token, r_get.text)
+            if not token:
+                return False
+
+            payload = _login_payload(self.username, self.password, token)
+            r_post = await self.client.post(CAS_URL, data=payload)
+            if r_post.status_code >= 500:
+                raise MoodleUnavailableError(f"CAS en erreur (HTTP {r_post.status_code})")
+
+            if on_moodle(r_post.url):
+                return await self._logged_in()
+            return False
+
+        except MoodleUnavailableError as e:
+            unreachable = True
+            print(f"❌ Connexion impossible : {e}")
+            raise
+        except httpx.HTTPError as e:
+            unreachable = True
             print(f"❌ Erreur réseau : {e}")
+            raise MoodleUnavailableError(f"CAS injoignable : {e}") from e
+        except Exception as e:
+            print(f"❌ Erreur connexion : {e}")
             return False
+        finally:
+            self._generation += 1
+            self._unreachable = unreachable
+            # Une panne n'est pas un refus du CAS : la reconnexion automatique reste permise
+            self._login_failed = not self.is_connected and not unreachable
 
-    def retrieve_user_id(self):
+    async def _logged_in(self):
+        self.is_connected = True
+        self._checked_at = time.monotonic()
+        if not self.user_id:
+            await self.retrieve_user_id()  # Première connexion : ID lu sur /my/
+        return True
+
+    async def retrieve_user_id(self):
         """Récupère l'ID utilisateur Moodle depuis la page d'accueil/profil"""
         try:
-            # On va sur la page d'accueil qui contient généralement un lien vers le profil
-            r = self.session.get("https://updago.univ-poitiers.fr/my/", timeout=30)
-            soup = BeautifulSoup(r.text, 'html.parser')
-            
-            # Recherche du lien de profil dans le menu utilisateur ou ailleurs
-            # Souvent de la forme: https://updago.univ-poitiers.fr/user/profile.php?id=XXXX
-            profile_link = soup.find('a', href=re.compile(r'user/profile\.php\?id=\d+'))
-            
-            if profile_link:
-                match = re.search(r'id=(\d+)', profile_link['href'])
-                if match:
-                    self.user_id = match.group(1)
-                    print(f"🆔 ID Utilisateur trouvé : {self.user_id}")
-                    return self.user_id
-            
+            r = await self.client.get(MY_URL)
+            user_id = await asyncio.to_thread(parse_user_id, r.text)
+
+            if user_id:
+                self.user_id = user_id
+                print(f"🆔 ID Utilisateur trouvé : {self.user_id}")
+                return self.user_id
+
             print("⚠️ Impossible de trouver l'ID utilisateur automatiquement.")
         except Exception as e:
             print(f"❌ Erreur récupération ID : {e}")
 
-    def get_all_courses(self):
-        """Récupère la liste des matières"""
+    async def get_all_courses(self):
+        """Récupère la liste des matières (None si la page n'a pas pu être lue, SessionExpiredError sans connexion,
+        MoodleUnavailableError si la reconnexion a échoué sur une panne)"""
         if not self.is_connected:
-            if not self.login():
-                return []
-        
+            if not await self._relogin(self._generation):
+                raise SessionExpiredError(f"Session Moodle de {self.username} expirée")
+
         if not self.user_id:
-             self.retrieve_user_id()
+            await self.retrieve_user_id()
 
-        url_overview = "https://updago.univ-poitiers.fr/grade/report/overview/index.php"
         try:
-            r = self.session.get(url_overview, timeout=30)
-            soup = BeautifulSoup(r.text, 'html.parser')
-            courses = []
-            seen_ids = set()
-
-            for link in soup.find_all('a', href=True):
-                match = re.search(r'id=(\d+)', link['href'])
-                if match and link.text.strip():
-                    c_id = match.group(1)
-                    c_name = link.text.strip()
-                    
-                    # Filtre anti-bruit (Annuaires, Pôles, etc.)
-                    blacklist = [
-                        "ENSIP", "IAE", "IPAG", "IUT16", "IUT86", 
-                        "Obtenir l’app mobile", "Scolarité", "Intranet", "Bibliothèque",
-                        "INSPE", "UFR", "Faculté", "Lettres et Langues", "Maison des Langues",
-                        "SAFIRE", "Services transverses", "UEO", "Auto-formation"
-                    ]
-                    if any(bad in c_name for bad in blacklist):
-                        continue
-                        
-                    if int(c_id) > 100 and c_id != self.user_id and c_id not in seen_ids:
-                        courses.append({"id": c_id, "name": c_name})
-                        seen_ids.add(c_id)
-            return courses
-        except Exception:
-            return []
+            r = await self._fetch(OVERVIEW_URL, limited=False)
+            if not r.is_success:
+                # Page de maintenance (503...) : pas de tableau, ce n'est pas "aucune matière"
+                print(f"❌ Erreur liste des matières : HTTP {r.status_code}")
+                return None
+            return await asyncio.to_thread(parse_courses, r.text, self.user_id)
+        except (SessionExpiredError, MoodleUnavailableError):
+            raise
+        except Exception as e:
+            print(f"❌ Erreur liste des matières : {e}")
+            return None
 
-    def get_grades_for_course(self, course_id):
-        """Récupère les notes d'une matière (Version Robuste)"""
+    async def get_grades_for_course(self, course_id, on_progress=None):
+        """Récupère les notes d'une matière (Version Robuste), None en cas d'échec (SessionExpiredError sans connexion).
+        on_progress(étape, course_id, notes) est appelé après le téléchargement ("fetched")
+        puis après le parsing ("parsed", avec la liste des notes)."""
         if not self.is_connected:
-            self.login()
+            await self._relogin(self._generation)
 
         if not self.user_id:
-            return []
+            return None
 
-        url = f"https://updago.univ-poitiers.fr/course/user.php?mode=grade&id={course_id}&user={self.user_id}"
+        url = GRADES_URL.format(course_id=course_id, user_id=self.user_id)
         try:
-            r = self.session.get(url, timeout=30)
-            soup = BeautifulSoup(r.text, 'html.parser')
-            grades = []
-            
-            # On cherche table avec user-grade OU generaltable (parfois l'un, parfois l'autre)
-            table = soup.find('table', class_='user-grade') or soup.find('table', class_='generaltable')
-            
-            if not table: 
-                # DEBUG: Si pas de table, on log l'URL pour vérifier manuellement si besoin
-                # print(f"⚠️ Pas de table trouvée pour {course_id}")
-                return []
-
-            for row in table.find_all('tr'):
-                # Protection si la ligne est vide
-                if not row.find('td'): continue
-                
-                name_cell = row.find(class_='column-itemname')
-                grade_cell = row.find(class_='column-grade')
-                range_cell = row.find(class_='column-range')
-                
-                if name_cell and grade_cell:
-                    raw_text_name = name_cell.text.strip()
-                    raw_grade = grade_cell.text.strip()
-                    
-                    if raw_grade in ["-", "", "Empty"]: continue
-                    if "tendance" in raw_text_name.lower(): continue 
-
-                    try:
-                        # Nettoyage de la note
-                        clean_grade = float(raw_grade.replace(',', '.').split()[0])
-                    except ValueError: 
-                        continue 
-
-                    max_grade = 20.0
-                    if range_cell:
-                        try:
-                            # Gestion robuste du range "0–20" ou "0-100"
-                            txt_range = range_cell.text.replace("–", "-").strip()
-                            parts = txt_range.split("-")
-                            if len(parts) >= 2: 
-                                max_grade = float(parts[-1].strip())
-                        except: 
-                            pass # On garde 20.0 par défaut
-                    
-                    is_total = "Total" in raw_text_name or "Moyenne" in raw_text_name
-                    
-                    grades.append({
-                        "name": raw_text_name.replace("Élément manuel", "").strip(),
-                        "grade": clean_grade,
-                        "max_grade": max_grade,
-                        "is_total": is_total
-                    })
+            r = await self._fetch(url)
+            if not r.is_success:
+                # Sans ce contrôle, la page d'erreur serait lue comme "aucune note" et les notes stockées effacées
+                print(f"❌ Erreur Scraper {course_id}: HTTP {r.status_code}")
+                return None
+            if on_progress: on_progress("fetched", course_id, None)
+            grades = await asyncio.to_thread(parse_grades, r.text)
+            if on_progress: on_progress("parsed", course_id, grades)
             return grades
+        except SessionExpiredError:
+            raise
         except Exception as e:
             print(f"❌ Erreur Scraper {course_id}: {e}")
+            return None
+
+    async def get_grades_for_courses(self, course_ids, max_workers=None, on_progress=None):
+        """Récupère les notes de plusieurs matières en parallèle (résultats dans l'ordre des IDs)"""
+        course_ids = list(course_ids)
+        if not course_ids:
             return []
 
+        # Connexion faite une seule fois avant de lancer les requêtes
+        # (sans session, chaque requête finirait sur le CAS : inutile de les lancer)
+        if not self.is_connected and not await self._relogin(self._generation):
+            raise SessionExpiredError(f"Session Moodle de {self.username} expirée")
+        if not self.user_id:
+            return [None for _ in course_ids]
+
+        workers = max_workers or SCRAPER_CONCURRENCY
+        limit = asyncio.Semaphore(max(1, min(workers, POOL_SIZE)))
+
+        async def fetch(course_id):
+            async with limit:
+                return await self.get_grades_for_course(course_id, on_progress)
+
+        return list(await asyncio.gather(*(fetch(c_id) for c_id in course_ids)))
+
+    async def aclose(self):
+        """Ferme le client HTTP et son pool de connexions"""
+        await self.client.aclose()
@@ -0,0 +1,323 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Sessions scraper gardées en mémoire (client HTTP + pool de connexions + identifiants)
+SCRAPER_STORE_MAX = int(os.getenv("SCRAPER_STORE_MAX", "200"))
+# Fermeture des sessions inutilisées depuis plus de N secondes
+SCRAPER_IDLE_TTL = float(os.getenv("SCRAPER_IDLE_TTL", "1800"))
+# Budget mémoire (Mo, 0 = pas de limite) converti en nombre de sessions via l'empreinte estimée d'une session
+SCRAPER_STORE_MAX_MB = float(os.getenv("SCRAPER_STORE_MAX_MB", "0"))
+SCRAPER_SESSION_KB = float(os.getenv("SCRAPER_SESSION_KB", "512"))
+
+# Backend de persistance des sessions : "memory" (un seul processus) ou "db" (partagé entre workers uvicorn)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+# Durée de conservation en base d'une session non rafraîchie (la session Moodle a expiré bien avant)
+SESSION_PERSIST_TTL = float(os.getenv("SESSION_PERSIST_TTL", str(12 * 3600)))
+
+# Fermetures asynchrones en cours : la boucle ne garde qu'une référence faible vers ses tâches
+_closing_tasks = set()
+
+def _closed(task):
+    _closing_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Fermeture du scraper impossible: {task.exception()}")
+
+def close_scraper(scraper):
+    """Ferme le client HTTP d'un scraper (async si possible, sinon synchrone)"""
+    aclose = getattr(scraper, "aclose", None)
+    if aclose is not None:
+        try:
+            task = asyncio.get_running_loop().create_task(aclose())
+            _closing_tasks.add(task)
+            task.add_done_callback(_closed)
+            return
+        except RuntimeError:
+            pass # Pas de boucle en cours : on tente la fermeture synchrone
+    close = getattr(scraper, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            print(f"⚠️ Fermeture du scraper impossible: {e}")
+
+class SessionCipher:
+    """Chiffrement symétrique (Fernet : AES-CBC + HMAC) des sessions stockées en base"""
+
+    def __init__(self, secret):
+        from cryptography.fernet import Fernet, InvalidToken # Requis uniquement avec SESSION_BACKEND=db
+        # Clé Fernet dérivée du secret configuré (n'importe quelle chaîne)
+        key = base64.urlsafe_b64encode(hashlib.sha256(b"scraper-session:" + secret.encode("utf-8")).digest())
+        self._fernet = Fernet(key)
+        self._invalid = InvalidToken
+
+    def encrypt(self, state):
+        return self._fernet.encrypt(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+    def decrypt(self, token):
+        """État déchiffré, ou None si le jeton est illisible (clé changée, donnée altérée)"""
+        try:
+            return json.loads(self._fernet.decrypt(token.encode("ascii")))
+        except self._invalid:
+            return None
+
+class DBSessionBackend:
+    """Sessions scraper (cookies + ID Moodle, jamais le mot de passe) chiffrées dans la table scraper_sessions.
+    Permet à n'importe quel worker de reprendre une session ouverte par un autre, sans reconnexion CAS."""
+
+    name = "db"
+
+    def __init__(self, connect, cipher, ttl=SESSION_PERSIST_TTL):
+        self.connect = connect # Fabrique de connexions DBConnection (main.get_db_connection)
+        self.cipher = cipher
+        self.ttl = ttl
+
+    def _cutoff(self):
+        from datetime import datetime, timedelta
+        return (datetime.now() - timedelta(seconds=self.ttl)).isoformat(timespec="seconds")
+
+    def save(self, username, state):
+        from datetime import datetime
+        with self.connect() as conn:
+            conn.cursor().execute("""
+                INSERT INTO scraper_sessions (username, payload, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(username) DO UPDATE SET payload = excluded.payload, updated_at = excluded.updated_at
+            """, (username, self.cipher.encrypt(state), datetime.now().isoformat(timespec="seconds")))
+
+    def load(self, username):
+        with self.connect() as conn:
+            row = conn.cursor().execute("SELECT payload FROM scraper_sessions WHERE username = ? AND updated_at >= ?",
+                                        (username, self._cutoff())).fetchone()
+        return self.cipher.decrypt(row['payload']) if row else None
+
+    def delete(self, username):
+        with self.connect() as conn:
+            conn.cursor().execute("DELETE FROM scraper_sessions WHERE username = ?", (username,))
+
+    def sweep(self):
+        """Supprime les sessions trop anciennes ; retourne leur nombre"""
+        with self.connect() as conn:
+            return conn.cursor().execute("DELETE FROM scraper_sessions WHERE updated_at < ?", (self._cutoff(),)).rowcount
+
+def make_session_backend(connect, secret):
+    """Backend choisi par SESSION_BACKEND (None = sessions uniquement en mémoire)"""
+    if SESSION_BACKEND == "memory":
+        return None
+    if SESSION_BACKEND == "db":
+        if not secret:
+            # Jamais de clé par défaut : les cookies Moodle stockés en base seraient déchiffrables par tous
+            raise RuntimeError("SESSION_BACKEND=db requiert une clé SESSION_ENCRYPTION_KEY explicite")
+        return DBSessionBackend(connect, SessionCipher(secret))
+    raise ValueError(f"SESSION_BACKEND inconnu: {SESSION_BACKEND}")
+
+class ScraperStore:
+    """Sessions scraper actives par utilisateur : LRU borné + expiration après inactivité.
+
+    Les sessions évincées ou expirées sont fermées (pool de connexions libéré).
+    Une session épinglée (rafraîchissement en cours) n'est jamais évincée ; remplacée ou oubliée,
+    elle n'est fermée qu'à la libération du dernier épinglage.
+    Avec un backend, la mémoire n'est qu'un cache local : une session absente est restaurée
+    depuis le backend (restore(username, état) -> scraper), y compris après éviction.
+    """
+
+    def __init__(self, max_entries=SCRAPER_STORE_MAX, idle_ttl=SCRAPER_IDLE_TTL, max_mb=SCRAPER_STORE_MAX_MB, session_kb=SCRAPER_SESSION_KB,
+                 backend=None, restore=None):
+        if max_mb > 0:
+            max_entries = min(max_entries, max(1, int(max_mb * 1024 / session_kb)))
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.session_kb = session_kb
+        self._entries = OrderedDict() # username -> (scraper, dernier accès)
+        self._pins = {} # username -> nombre d'utilisations en cours
+        self._retired = {} # username -> sessions retirées du cache mais encore épinglées (fermées au dépinglage)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend = backend
+        self.restore = restore
+        self.restored = 0
+
+    def _expired(self, last_used, now):
+        return self.idle_ttl > 0 and now - last_used > self.idle_ttl
+
+    def get(self, username, default=None):
+        closed = None
+        with self._lock:
+            entry = self._entries.get(username)
+            now = time.monotonic()
+            if entry is not None and self._expired(entry[1], now) and not self._pins.get(username):
+                closed = self._entries.pop(username)[0]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                result = default
+            else:
+                self._entries[username] = (entry[0], now)
+                self._entries.move_to_end(username)
+                self.hits += 1
+                result = entry[0]
+        if closed is not None:
+            close_scraper(closed)
+        return result
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    def __getitem__(self, username):
+        scraper = self.get(username)
+        if scraper is None:
+            raise KeyError(username)
+        return scraper
+
+    def __setitem__(self, username, scraper):
+        """Enregistre la session (l'éventuelle précédente est fermée) puis applique la limite"""
+        to_close = []
+        with self._lock:
+            previous = self._entries.pop(username, None)
+            if previous is not None and previous[0] is not scraper:
+                to_close += self._retire(username, previous[0])
+            self._entries[username] = (scraper, time.monotonic())
+            to_close += self._evict_overflow()
+        for old in to_close:
+            close_scraper(old)
+
+    def _retire(self, username, scraper):
+        """Session retirée du cache : à fermer tout de suite, ou au dépinglage si elle sert encore (verrou déjà pris)"""
+        if self._pins.get(username):
+            self._retired.setdefault(username, []).append(scraper)
+            return []
+        return [scraper]
+
+    def _evict_overflow(self):
+        """Retire les sessions les moins récemment utilisées au-delà de max_entries (verrou déjà pris)"""
+        evicted = []
+        candidates = (u for u in list(self._entries) if not self._pins.get(u))
+        while len(self._entries) > self.max_entries:
+            username = next(candidates, None)
+            if username is None:
+                break # Tout est épinglé : dépassement temporaire
+            evicted.append(self._entries.pop(username)[0])
+            self.evictions += 1
+        return evicted
+
+    def sweep(self):
+        """Ferme les sessions inactives depuis plus de idle_ttl ; retourne leur nombre"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [u for u, (_, last_used) in self._entries.items() if self._expired(last_used, now) and not self._pins.get(u)]
+            closed = [self._entries.pop(u)[0] for u in expired]
+            self.expirations += len(closed)
+        for scraper in closed:
+            close_scraper(scraper)
+        return len(closed)
+
+    @contextmanager
+    def pinned(self, username):
+        """Session de l'utilisateur protégée de l'éviction le temps du bloc (None si absente)"""
+        scraper = self.get(username)
+        with self._lock:
+            self._pins[username] = self._pins.get(username, 0) + 1
+        try:
+            yield scraper
+        finally:
+            retired = []
+            with self._lock:
+                self._pins[username] -= 1
+                if not self._pins[username]:
+                    del self._pins[username]
+                    retired = self._retired.pop(username, [])
+            for old in retired:
+                close_scraper(old)
+
+    async def aget(self, username):
+        """Comme get(), mais restaure depuis le backend une session ouverte par un autre worker"""
+        scraper = self.get(username)
+        if scraper is not None or self.backend is None:
+            return scraper
+        state = await asyncio.to_thread(self.backend.load, username)
+        if not state:
+            return None
+        scraper = self.restore(username, state)
+        with self._lock:
+            existing = self._entries.get(username)
+            if existing is None:
+                self._entries[username] = (scraper, time.monotonic())
+                self.restored += 1
+                to_close = self._evict_overflow()
+        if existing is not None:
+            # Restaurée en parallèle par une autre requête : on garde la première
+            close_scraper(scraper)
+            return existing[0]
+        for old in to_close:
+            close_scraper(old)
+        return scraper
+
+    async def put(self, username, scraper):
+        """Enregistre la session en mémoire puis dans le backend"""
+        self[username] = scraper
+        await self.persist(username)
+
+    async def persist(self, username):
+        """Sauvegarde l'état courant (cookies éventuellement renouvelés) de la session dans le backend"""
+        scraper = self.get(username)
+        if self.backend is None or scraper is None:
+            return
+        try:
+            await asyncio.to_thread(self.backend.save, username, scraper.export_state())
+        except Exception as e:
+            # Facultatif : la session reste utilisable dans ce processus
+            print(f"⚠️ Session de {username} non enregistrée: {e}")
+
+    async def discard(self, username):
+        """Oublie la session (déconnexion) : mémoire et backend"""
+        with self._lock:
+            entry = self._entries.pop(username, None)
+            # Un rafraîchissement en cours garde son client jusqu'à la fin
+            to_close = self._retire(username, entry[0]) if entry is not None else []
+        for old in to_close:
+            close_scraper(old)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.delete, username)
+
+    async def sweep_backend(self):
+        """Purge les sessions expirées du backend ; retourne leur nombre"""
+        if self.backend is None:
+            return 0
+        return await asyncio.to_thread(self.backend.sweep)
+
+    def values(self):
+        with self._lock:
+            return [scraper for scraper, _ in self._entries.values()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            live = len(self._entries)
+            return {
+                "live_sessions": live,
+                "pinned_sessions": len(self._pins),
+                "max_entries": self.max_entries,
+                "idle_ttl": self.idle_ttl,
+                "estimated_kb": live * self.session_kb,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "backend": self.backend.name if self.backend is not None else "memory",
+                "restored": self.restored,
+            }
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# L'application lit ses fichiers (templates, static, maquettes, aliases.json) en chemins relatifs
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Base SQLite vide dans un répertoire temporaire (jamais notes.db ni DATABASE_URL)"""
+    import main
+    monkeypatch.setattr(main, "DATABASE_URL", None)
+    monkeypatch.setattr(main, "DB_FILE", str(tmp_path / "notes.db"))
+    return main
@@ -0,0 +1,195 @@
+import asyncio
+import re
+from collections import Counter
+
+import httpx
+import pytest
+
+import scraper
+from scraper import AsyncMoodleScraper, MoodleUnavailableError, SessionExpiredError
+from session_store import ScraperStore
+
+MOODLE = "https://" + scraper.MOODLE_HOST
+
+class FakeMoodle:
+    """CAS + Moodle simulés : sessions Moodle, ticket CAS (TGC) et pannes"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.sessions = set()
+        self.tickets = set()
+        self.down = False # Erreur réseau sur toute requête
+        self.cas_status = 200
+
+    def __call__(self, request):
+        url = request.url
+        self.calls[f"{request.method} {url.host}{url.path}"] += 1
+        if self.down:
+            raise httpx.ConnectError("connexion refusée", request=request)
+        cookies = request.headers.get("cookie", "")
+        session = re.search(r"MoodleSession=(\w+)", cookies)
+        ticket = re.search(r"TGC=(\w+)", cookies)
+        if url.host == scraper.CAS_HOST:
+            if self.cas_status >= 500:
+                return httpx.Response(self.cas_status, text="Service indisponible")
+            if request.method == "GET" and ticket and ticket.group(1) in self.tickets:
+                return httpx.Response(302, headers={"location": MOODLE + "/login/index.php?authCAS=CAS&ticket=ST"})
+            if request.method == "POST" and "password=good" in request.content.decode():
+                self.tickets.add("t1")
+                return httpx.Response(302, headers={"location": MOODLE + "/login/index.php?authCAS=CAS&ticket=ST",
+                                                    "set-cookie": f"TGC=t1; Path=/cas; Domain={scraper.CAS_HOST}"})
+            return httpx.Response(401 if request.method == "POST" else 200, text='<form><input name="execution" value="tok"></form>')
+        if url.path.startswith("/login/"):
+            if "ticket" in str(url):
+                sid = f"s{len(self.sessions) + 1}"
+                self.sessions.add(sid)
+                return httpx.Response(303, headers={"location": MOODLE + "/my/", "set-cookie": f"MoodleSession={sid}; Path=/"})
+            return httpx.Response(303, headers={"location": scraper.CAS_URL})
+        if not (session and session.group(1) in self.sessions):
+            return httpx.Response(303, headers={"location": MOODLE + "/login/index.php"})
+        if url.path == "/my/":
+            return httpx.Response(200, text='<a href="/user/profile.php?id=42">profil</a>')
+        if url.path.startswith("/grade/report/overview"):
+            return httpx.Response(200, text='<a href="/course/user.php?id=7">S3 Anglais</a>')
+        return httpx.Response(200, text='<table class="user-grade"><tr><td class="column-itemname">Oral</td>'
+                                        '<td class="column-grade">14,00</td><td class="column-range">0–20</td></tr></table>')
+
+    def expire(self, keep_ticket=True):
+        self.sessions.clear()
+        if not keep_ticket:
+            self.tickets.clear()
+
+def connect(moodle, password="good", state=None):
+    s = AsyncMoodleScraper.from_state("alice", state) if state else AsyncMoodleScraper("alice", password, "42")
+    s.client = httpx.AsyncClient(transport=httpx.MockTransport(moodle), follow_redirects=True, cookies=s.client.cookies)
+    return s
+
+def test_expired_session_relogs_in_once_for_concurrent_requests():
+    moodle = FakeMoodle()
+    async def run():
+        s = connect(moodle)
+        assert await s.login()
+        moodle.expire(keep_ticket=False) # Session Moodle et ticket CAS perdus
+        moodle.calls.clear()
+        grades = await s.get_grades_for_courses(["7", "8", "9", "10"])
+        await s.aclose()
+        return grades
+    grades = asyncio.run(run())
+    assert all(g and g[0]["grade"] == 14.0 for g in grades)
+    assert moodle.calls[f"POST {scraper.CAS_HOST}/cas/login"] == 1 # Une seule reconnexion pour les 4 requêtes
+
+def test_recent_session_skips_the_probe():
+    moodle = FakeMoodle()
+    async def run():
+        s = connect(moodle)
+        assert await s.login()
+        moodle.calls.clear()
+        assert await s.ensure_session()
+        await s.aclose()
+    asyncio.run(run())
+    assert sum(moodle.calls.values()) == 0
+
+def test_confirmed_login_redirect_raises_session_expired():
+    moodle = FakeMoodle()
+    async def run():
+        s = connect(moodle)
+        assert await s.login()
+        state = s.export_state()
+        await s.aclose()
+        moodle.expire(keep_ticket=False)
+        restored = connect(moodle, state=state) # Pas de mot de passe : reconnexion impossible
+        try:
+            with pytest.raises(SessionExpiredError):
+                await restored.get_all_courses()
+            assert not await restored.ensure_session()
+        finally:
+            await restored.aclose()
+    asyncio.run(run())
+
+def test_network_error_is_not_an_expired_session():
+    moodle = FakeMoodle()
+    async def run():
+        s = connect(moodle)
+        assert await s.login()
+        moodle.down = True
+        s._checked_at = 0 # Force la sonde
+        try:
+            with pytest.raises(MoodleUnavailableError):
+                await s.ensure_session()
+            assert s.is_connected # La session n'est pas déclarée expirée
+            s.is_connected = False
+            with pytest.raises(MoodleUnavailableError):
+                await s.ensure_session() # Reconnexion impossible : panne, pas refus
+            moodle.down = False
+            assert await s.ensure_session() # Panne terminée : nouvelle tentative permise
+        finally:
+            await s.aclose()
+    asyncio.run(run())
+
+def test_cas_server_error_is_unavailable():
+    moodle = FakeMoodle()
+    moodle.cas_status = 503
+    async def run():
+        s = connect(moodle)
+        try:
+            assert not await s.login()
+            with pytest.raises(MoodleUnavailableError):
+                await s.ensure_session()
+        finally:
+            await s.aclose()
+    asyncio.run(run())
+
+class JobScraper:
+    """Scraper minimal pour les jobs : ensure_session() décide du sort du job"""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.closed = False
+
+    async def ensure_session(self):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+    def export_state(self):
+        return {"user_id": "42", "cookies": []}
+
+    async def aclose(self):
+        self.closed = True
+
+def run_job(main, monkeypatch, scraper_):
+    store = ScraperStore(max_entries=5, idle_ttl=0)
+    monkeypatch.setattr(main, "active_scrapers", store)
+    async def run():
+        store["alice"] = scraper_
+        queue = main.RefreshQueue(1)
+        queue.start()
+        job_id = await queue.submit("alice")
+        await queue.queue.join()
+        await queue.stop()
+        return main.get_refresh_job(job_id, "alice"), store.get("alice")
+    return asyncio.run(run())
+
+def test_outage_fails_the_job_and_keeps_the_session(db, monkeypatch):
+    db.init_db()
+    scraper_ = JobScraper(MoodleUnavailableError("Moodle injoignable"))
+    job, kept = run_job(db, monkeypatch, scraper_)
+    assert job["status"] == "failed"
+    assert kept is scraper_ and not scraper_.closed
+
+def test_expired_session_requeues_the_job_and_drops_the_session(db, monkeypatch):
+    db.init_db()
+    scraper_ = JobScraper(False)
+    job, kept = run_job(db, monkeypatch, scraper_)
+    assert job["status"] == "queued" and job["started_at"] is None
+    assert job["error"] == db.SESSION_EXPIRED_MESSAGE
+    assert kept is None and scraper_.closed
+
+def test_requeued_job_can_be_claimed_again(db):
+    db.init_db()
+    job_id, _ = db.enqueue_refresh_job("alice")
+    assert db.claim_refresh_job(job_id)
+    assert not db.claim_refresh_job(job_id) # Déjà pris par un autre worker
+    db.requeue_refresh_job(job_id, db.SESSION_EXPIRED_MESSAGE)
+    assert db.pending_refresh_jobs("alice") == [(job_id, "alice")]
+    assert db.claim_refresh_job(job_id)
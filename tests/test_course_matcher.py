@@ -0,0 +1,62 @@
+from course_matcher import AliasAutomaton, AliasTable, CourseMatcher, TrigramIndex
+
+COURSES = ["Systèmes d'information décisionnels", "Anglais", "Technologies web"]
+TEACHERS = {"Anglais": "M. Gouméziane", "Technologies web": "Mme Dupont"}
+
+def test_teacher_rule_prefers_maquette_order():
+    matcher = CourseMatcher(COURSES, TEACHERS, aliases=AliasTable([]))
+    # Les deux enseignants sont cités : le premier dans l'ordre de la maquette l'emporte
+    assert matcher.explain("Cours Dupont et Gouméziane")[:2] == ("Anglais", "teacher")
+
+def test_keyword_rule_counts_exact_and_partial_words():
+    matcher = CourseMatcher(COURSES, TEACHERS, aliases=AliasTable([]))
+    exact = matcher.explain("S3 Systèmes décisionnels")
+    partial = matcher.explain("S3 SID informations") # "information" contenu dans "informations"
+    assert exact[:2] == partial[:2] == ("Systèmes d'information décisionnels", "keyword")
+    assert exact[2] > partial[2]
+    assert matcher.explain("zzz") == (None, None, 0.0)
+
+def test_decision_cache_is_bounded():
+    matcher = CourseMatcher(["Anglais", "Technologies web", "Régression"], aliases=AliasTable([]), cache_size=2)
+    for name in ("S3 Anglais", "S3 Technologie Web", "S4 Régression"):
+        matcher.match(name)
+    assert len(matcher._cache) == 2
+    assert not matcher.is_known("s3 anglais") # La plus ancienne décision est évincée
+    assert matcher.match("S3 Anglais") == "Anglais" # ... et recalculée à l'identique
+
+def test_automaton_finds_overlapping_patterns():
+    automaton = AliasAutomaton(["he", "she", "his", "hers"])
+    hits = sorted(automaton.find_all("ushers"))
+    # (position de fin, index du motif) : "she" et "he" finissent au même caractère
+    assert hits == [(3, 0), (3, 1), (5, 3)]
+
+def test_automaton_follows_failure_links():
+    automaton = AliasAutomaton(["abcd", "bc"])
+    assert automaton.find_all("abce") == [(2, 1)]
+
+def test_automaton_without_patterns_finds_nothing():
+    assert AliasAutomaton([]).find_all("texte quelconque") == []
+
+def test_alias_table_priority_then_length_then_position():
+    table = AliasTable([
+        {"alias": "web", "target": "Développement web"},
+        {"alias": "techno web", "target": "Technologies web"},
+        {"alias": "anglais", "target": "Anglais", "priority": 5},
+    ])
+    assert table.lookup("s3 techno web") == "Technologies web" # Alias le plus long
+    assert table.lookup("s3 anglais techno web") == "Anglais" # Priorité déclarée
+    assert table.lookup("s3 regression") is None
+
+def test_alias_table_earliest_alias_wins_a_tie():
+    table = AliasTable([{"alias": "sas", "target": "SAS"}, {"alias": "sql", "target": "SQL"}])
+    assert table.lookup("tp sql puis sas") == "SQL"
+
+def test_alias_lookup_is_case_insensitive_on_aliases():
+    assert AliasTable([{"alias": "Web", "target": "Web"}]).lookup("s3 web") == "Web"
+
+def test_trigram_batch_matches_one_by_one():
+    index = TrigramIndex(COURSES)
+    names = ["S3 Tech Web", "Anglai", "Systemes decisionnel", "xyz", "", "Anglai"]
+    assert index.best_many(names) == {name: index.best(name) for name in names}
+    assert index.best("S3 Tech Web")[0] == 2
+    assert index.best("xyz") is None
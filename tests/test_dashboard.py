@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from maquette_service import MaquetteService
+from models import to_json
+
+def course(c_id, name, *grades):
+    notes = [{"name": n, "grade": g, "max_grade": 20.0, "is_total": False} for n, g in grades]
+    return {"course": {"id": c_id, "name": name}, "grades": notes, "average": None}
+
+COURSES = [
+    course("1", "S3 Anglais", ("Oral", 14.0), ("Écrit", 11.0)),
+    course("2", "S3 Technologie Web", ("TP1", 12.0)),
+    course("3", "S3 - Département SD", ("Cookie", 15.0)),
+    course("4", "S4 Régression", ("DS", 9.0)),
+    course("5", "S4 Anglais", ("Oral", 16.0)),
+]
+
+@pytest.fixture
+def dashboard(db, monkeypatch):
+    """Base migrée, maquettes chargées et un utilisateur avec des notes S3 / S4"""
+    monkeypatch.setattr(db, "maquette_service", MaquetteService())
+    db.init_db()
+    db.sync_user_courses("alice", COURSES)
+    return db
+
+def settings_of(main, username="alice"):
+    with main.get_db_connection() as conn:
+        return dict(conn.cursor().execute("SELECT * FROM user_settings WHERE username = ?", (username,)).fetchone())
+
+def user_data_of(main, username="alice"):
+    with main.get_db_connection() as conn:
+        return main.load_user_data(conn.cursor(), username)
+
+def as_json(stats):
+    return json.loads(json.dumps(stats, default=to_json, sort_keys=True))
+
+def test_snapshot_is_served_for_the_current_version(dashboard):
+    settings = settings_of(dashboard)
+    snapshot = dashboard.build_snapshot(user_data_of(dashboard), settings)
+    with dashboard.get_db_connection() as conn:
+        dashboard.save_snapshot(conn.cursor(), "alice", settings, snapshot)
+    with dashboard.get_db_connection() as conn:
+        assert dashboard.load_snapshot(conn.cursor(), "alice", settings) == as_json(snapshot)
+
+def test_data_change_invalidates_the_snapshot(dashboard):
+    dashboard.refresh_user_snapshot("alice")
+    dashboard.apply_user_change("alice", "INSERT INTO manual_grades (username, course_canonical_name, name, grade, max_grade, coef) VALUES (?, ?, ?, ?, ?, ?)",
+                                ("alice", "Anglais", "Bonus", 20.0, 20.0, 1.0))
+    settings = settings_of(dashboard)
+    with dashboard.get_db_connection() as conn:
+        c = conn.cursor()
+        assert dashboard.load_snapshot(c, "alice", settings) is not None # Recalculé avec la nouvelle version
+        c.execute("UPDATE user_settings SET data_version = data_version + 1 WHERE username = 'alice'")
+    settings = settings_of(dashboard)
+    with dashboard.get_db_connection() as conn:
+        assert dashboard.load_snapshot(conn.cursor(), "alice", settings) is None
+
+def test_settings_change_invalidates_the_snapshot(dashboard):
+    dashboard.refresh_user_snapshot("alice")
+    settings = settings_of(dashboard)
+    other = dict(settings, option="VCOD" if settings["option"] != "VCOD" else "EMS")
+    assert dashboard.snapshot_stamp(other) != dashboard.snapshot_stamp(settings)
+    with dashboard.get_db_connection() as conn:
+        c = conn.cursor()
+        assert dashboard.load_snapshot(c, "alice", settings) is not None
+        assert dashboard.load_snapshot(c, "alice", other) is None
+
+def test_older_snapshot_never_overwrites_a_newer_one(dashboard):
+    settings = settings_of(dashboard)
+    newer = dict(settings, data_version=(settings["data_version"] or 0) + 1)
+    with dashboard.get_db_connection() as conn:
+        c = conn.cursor()
+        dashboard.save_snapshot(c, "alice", newer, {"has_courses": True, "marker": "newer"})
+        dashboard.save_snapshot(c, "alice", settings, {"has_courses": True, "marker": "older"})
+        assert dashboard.load_snapshot(c, "alice", newer)["marker"] == "newer"
+
+def test_year_pass_matches_each_semester(dashboard):
+    settings = settings_of(dashboard)
+    data = user_data_of(dashboard)
+    year = dashboard.year_stats_for(data, settings["option"], settings["status"])
+    for sem in ("S3", "S4"):
+        alone = dashboard.stats_for(data, sem, settings["option"], settings["status"])
+        assert alone is not None
+        assert as_json(year[sem]) == as_json(alone)
+
+def test_year_aggregates_match_the_semesters(dashboard):
+    settings = settings_of(dashboard)
+    year = dashboard.year_stats_for(user_data_of(dashboard), settings["option"], settings["status"])
+    annual, average = dashboard.year_aggregates(year["S3"], year["S4"])
+    assert year["year"] == {"annual_competences": annual, "global_average": average}
+    assert annual # Des UE sont bien calculées
+
+def test_year_aggregates_fall_back_to_the_available_semester(db):
+    s3 = {"comp_averages": {"UE 1": 12.0, "UE 2": 8.0}}
+    s4 = {"comp_averages": {"UE 1": 14.0, "UE 2": None, "UE 3": 10.0}}
+    annual, average = db.year_aggregates(s3, s4)
+    assert annual == {"UE 1": 13.0, "UE 2": 8.0, "UE 3": 10.0}
+    assert average == pytest.approx((13.0 + 8.0 + 10.0) / 3)
+    assert db.year_aggregates(None, s4) == ({"UE 1": 14.0, "UE 3": 10.0}, 12.0)
+    assert db.year_aggregates(None, None) == ({}, None)
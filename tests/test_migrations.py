@@ -0,0 +1,71 @@
+import sqlite3
+import threading
+
+import pytest
+
+def versions(main):
+    conn = sqlite3.connect(main.DB_FILE)
+    try:
+        return [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    finally:
+        conn.close()
+
+def test_fresh_database_gets_every_migration_once(db):
+    db.init_db()
+    assert versions(db) == [version for version, _, _ in db.MIGRATIONS]
+
+def test_init_db_is_idempotent(db):
+    db.init_db()
+    db.init_db()
+    assert versions(db) == [version for version, _, _ in db.MIGRATIONS]
+    with db.get_db_connection() as conn:
+        assert db.schema_version(conn.cursor()) == db.MIGRATIONS[-1][0]
+
+def test_only_pending_migrations_run(db, monkeypatch):
+    applied = []
+    extra = (db.MIGRATIONS[-1][0] + 1, "test", lambda conn, c: applied.append(True))
+    db.init_db()
+    monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS + [extra])
+    db.init_db()
+    db.init_db()
+    assert applied == [True]
+    assert versions(db)[-1] == extra[0]
+
+def test_failed_migration_is_rolled_back(db, monkeypatch):
+    db.init_db()
+    latest = db.MIGRATIONS[-1][0]
+    def broken(conn, c):
+        c.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("boom")
+    monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS + [(latest + 1, "broken", broken)])
+    with pytest.raises(RuntimeError):
+        db.init_db()
+    conn = sqlite3.connect(db.DB_FILE)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+    conn.close()
+    assert versions(db)[-1] == latest
+
+def test_concurrent_init_applies_each_migration_once(db):
+    # Un thread = une connexion SQLite : même concurrence que plusieurs workers au démarrage
+    errors = []
+    start = threading.Barrier(4)
+    def worker():
+        start.wait()
+        try:
+            db.init_db()
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert versions(db) == [version for version, _, _ in db.MIGRATIONS]
+
+def test_schema_table_is_created_under_the_lock(db):
+    with db.get_db_connection() as conn:
+        assert not db.has_schema_version_table(conn, conn.cursor()) # Base neuve : rien créé hors verrou
+    db.init_db()
+    with db.get_db_connection() as conn:
+        assert db.has_schema_version_table(conn, conn.cursor())
@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+
+import pytest
+
+@pytest.fixture
+def jobs_db(db):
+    db.init_db()
+    return db
+
+def test_enqueue_reuses_the_active_job(jobs_db):
+    job_id, created = jobs_db.enqueue_refresh_job("alice")
+    assert created
+    assert jobs_db.enqueue_refresh_job("alice") == (job_id, False)
+    assert jobs_db.claim_refresh_job(job_id)
+    assert jobs_db.enqueue_refresh_job("alice") == (job_id, False) # Toujours actif en "running"
+    other_id, created = jobs_db.enqueue_refresh_job("bob")
+    assert created and other_id != job_id
+
+def test_finished_job_allows_a_new_one(jobs_db):
+    job_id, _ = jobs_db.enqueue_refresh_job("alice")
+    jobs_db.set_refresh_job_status(job_id, "done")
+    new_id, created = jobs_db.enqueue_refresh_job("alice")
+    assert created and new_id != job_id
+
+def test_unique_index_rejects_a_second_active_job(jobs_db):
+    jobs_db.enqueue_refresh_job("alice")
+    conn = sqlite3.connect(jobs_db.DB_FILE)
+    try:
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO refresh_jobs (username, status, created_at) VALUES ('alice', 'running', 'now')")
+        conn.execute("INSERT INTO refresh_jobs (username, status, created_at) VALUES ('alice', 'failed', 'now')")
+    finally:
+        conn.close()
+
+def test_concurrent_enqueue_creates_a_single_job(jobs_db):
+    results = []
+    start = threading.Barrier(8)
+    def worker():
+        start.wait()
+        results.append(jobs_db.enqueue_refresh_job("alice"))
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({job_id for job_id, _ in results}) == 1
+    assert sum(created for _, created in results) == 1
+
+def age_job(main, job_id, seconds):
+    """Recule started_at comme si le job tournait depuis seconds secondes"""
+    from datetime import datetime, timedelta
+    started = (datetime.now() - timedelta(seconds=seconds)).isoformat(timespec="seconds")
+    conn = sqlite3.connect(main.DB_FILE)
+    with conn:
+        conn.execute("UPDATE refresh_jobs SET started_at = ? WHERE id = ?", (started, job_id))
+    conn.close()
+
+def test_restarting_worker_leaves_live_jobs_alone(jobs_db):
+    job_id, _ = jobs_db.enqueue_refresh_job("alice")
+    assert jobs_db.claim_refresh_job(job_id) # Exécuté par un autre worker, toujours en vie
+    assert jobs_db.pending_refresh_jobs() == []
+    assert not jobs_db.claim_refresh_job(job_id)
+    assert jobs_db.get_refresh_job(job_id, "alice")["status"] == "running"
+
+def test_orphaned_running_job_is_reclaimed(jobs_db):
+    job_id, _ = jobs_db.enqueue_refresh_job("alice")
+    assert jobs_db.claim_refresh_job(job_id)
+    age_job(jobs_db, job_id, jobs_db.REFRESH_JOB_TIMEOUT + jobs_db.REFRESH_JOB_LEASE_MARGIN + 5)
+    assert jobs_db.pending_refresh_jobs() == [(job_id, "alice")]
+    assert jobs_db.claim_refresh_job(job_id)
+
+def test_enqueue_requeues_an_orphaned_job(jobs_db):
+    job_id, _ = jobs_db.enqueue_refresh_job("alice")
+    assert jobs_db.claim_refresh_job(job_id)
+    age_job(jobs_db, job_id, jobs_db.REFRESH_JOB_TIMEOUT + jobs_db.REFRESH_JOB_LEASE_MARGIN + 5)
+    assert jobs_db.enqueue_refresh_job("alice") == (job_id, False)
+    assert jobs_db.get_refresh_job(job_id, "alice")["status"] == "queued"
+
+def test_worker_survives_a_failing_status_update(jobs_db, monkeypatch):
+    import asyncio
+
+    ran = []
+    async def run(self, job_id, username, progress):
+        ran.append(job_id)
+        raise RuntimeError("scraping en échec")
+    def db_down(*args):
+        raise RuntimeError("BDD indisponible")
+    monkeypatch.setattr(jobs_db.RefreshQueue, "_run", run)
+    monkeypatch.setattr(jobs_db, "set_refresh_job_status", db_down)
+
+    async def scenario():
+        queue = jobs_db.RefreshQueue(1)
+        queue.start()
+        first = await queue.submit("alice")
+        second = await queue.submit("bob")
+        await asyncio.wait_for(queue.queue.join(), 5)
+        alive = not queue._tasks[0].done()
+        await queue.stop()
+        return first, second, alive, queue.progress[first]
+    first, second, alive, progress = asyncio.run(scenario())
+    assert ran == [first, second] and alive # Le même worker a traité le second job
+    assert progress.finished and progress.events[-1][0] == "failed"
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+import session_store
+from session_store import ScraperStore
+
+class FakeScraper:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge monotone pilotée par le test"""
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "monotonic", lambda: now[0])
+    return now
+
+def test_lru_eviction_closes_least_recently_used():
+    store = ScraperStore(max_entries=2, idle_ttl=0)
+    a, b, c = FakeScraper("a"), FakeScraper("b"), FakeScraper("c")
+    store["a"], store["b"] = a, b
+    assert store.get("a") is a # "b" devient la moins récente
+    store["c"] = c
+    assert store.get("b") is None and b.closed
+    assert store.get("a") is a and store.get("c") is c
+    assert not a.closed and not c.closed
+    assert store.evictions == 1
+
+def test_max_mb_caps_entries():
+    assert ScraperStore(max_entries=200, max_mb=1, session_kb=512).max_entries == 2
+
+def test_replacing_a_session_closes_the_previous_one():
+    store = ScraperStore(max_entries=5, idle_ttl=0)
+    old, new = FakeScraper("old"), FakeScraper("new")
+    store["u"] = old
+    store["u"] = new
+    assert old.closed and not new.closed
+    store["u"] = new # Même objet : pas de fermeture
+    assert not new.closed
+
+def test_idle_sessions_expire(clock):
+    store = ScraperStore(max_entries=5, idle_ttl=60)
+    idle, active = FakeScraper("idle"), FakeScraper("active")
+    store["idle"], store["active"] = idle, active
+    clock[0] += 50
+    store.get("active") # Accès : l'inactivité repart de zéro
+    clock[0] += 20
+    assert store.sweep() == 1
+    assert idle.closed and not active.closed
+    clock[0] += 61
+    assert store.get("active") is None and active.closed
+    assert store.expirations == 2
+
+def test_pinned_session_is_neither_evicted_nor_expired(clock):
+    store = ScraperStore(max_entries=1, idle_ttl=60)
+    busy = FakeScraper("busy")
+    store["busy"] = busy
+    with store.pinned("busy") as scraper:
+        assert scraper is busy
+        other = FakeScraper("other")
+        store["other"] = other # Limite atteinte : la session non épinglée part, même plus récente
+        assert other.closed and store.get("busy") is busy
+        clock[0] += 120
+        assert store.sweep() == 0
+        assert store.get("busy") is busy and not busy.closed
+        assert store.stats()["pinned_sessions"] == 1
+    assert store.stats()["pinned_sessions"] == 0
+
+def test_pinned_missing_session_yields_none():
+    store = ScraperStore(max_entries=2, idle_ttl=0)
+    with store.pinned("ghost") as scraper:
+        assert scraper is None
+
+def test_session_retired_while_pinned_closes_on_last_unpin():
+    store = ScraperStore(max_entries=5, idle_ttl=0)
+    old = FakeScraper("old")
+    store["u"] = old
+    with store.pinned("u"):
+        with store.pinned("u"):
+            store["u"] = FakeScraper("new") # Reconnexion pendant un rafraîchissement
+        assert not old.closed # Encore utilisée par le premier épinglage
+    assert old.closed
+
+def test_discard_while_pinned_defers_close():
+    store = ScraperStore(max_entries=5, idle_ttl=0)
+    scraper = FakeScraper("u")
+    store["u"] = scraper
+    with store.pinned("u"):
+        asyncio.run(store.discard("u"))
+        assert store.get("u") is None and not scraper.closed
+    assert scraper.closed
+
+def test_discard_closes_unpinned_session():
+    store = ScraperStore(max_entries=5, idle_ttl=0)
+    scraper = FakeScraper("u")
+    store["u"] = scraper
+    asyncio.run(store.discard("u"))
+    assert scraper.closed and "u" not in store
+
+def test_close_scraper_keeps_pending_async_closes():
+    class AsyncScraper:
+        closed = False
+        async def aclose(self):
+            await asyncio.sleep(0)
+            self.closed = True
+
+    async def run():
+        scraper = AsyncScraper()
+        session_store.close_scraper(scraper)
+        assert len(session_store._closing_tasks) == 1
+        await asyncio.sleep(0.01)
+        return scraper
+
+    assert asyncio.run(run()).closed
+    assert not session_store._closing_tasks
+
+def test_db_backend_requires_explicit_key(monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_BACKEND", "db")
+    with pytest.raises(RuntimeError):
+        session_store.make_session_backend(lambda: None, None)
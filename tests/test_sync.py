@@ -0,0 +1,84 @@
+import asyncio
+import sqlite3
+
+import httpx
+import pytest
+
+import scraper
+
+def course(c_id, name, *grades):
+    notes = [{"name": n, "grade": g, "max_grade": 20.0, "is_total": False} for n, g in grades]
+    return {"course": {"id": c_id, "name": name}, "grades": notes, "average": None}
+
+@pytest.fixture
+def sync_db(db):
+    db.init_db()
+    return db
+
+def stored(main, username="alice"):
+    conn = sqlite3.connect(main.DB_FILE)
+    try:
+        grades = conn.execute("SELECT course_id, name, grade FROM grades WHERE username = ? ORDER BY course_id, name", (username,)).fetchall()
+        version = conn.execute("SELECT data_version FROM user_settings WHERE username = ?", (username,)).fetchone()[0]
+        return grades, version
+    finally:
+        conn.close()
+
+def test_unchanged_courses_are_not_rewritten(sync_db):
+    data = [course("1", "Anglais", ("Oral", 14.0)), course("2", "Web", ("TP", 12.0))]
+    sync_db.sync_user_courses("alice", data)
+    grades, version = stored(sync_db)
+    sync_db.sync_user_courses("alice", data)
+    assert stored(sync_db) == (grades, version) # Aucune écriture : la version ne bouge pas
+
+def test_changed_course_is_rewritten_and_removed_course_deleted(sync_db):
+    sync_db.sync_user_courses("alice", [course("1", "Anglais", ("Oral", 14.0)), course("2", "Web", ("TP", 12.0))])
+    _, version = stored(sync_db)
+    sync_db.sync_user_courses("alice", [course("1", "Anglais", ("Oral", 15.0))])
+    grades, new_version = stored(sync_db)
+    assert grades == [("1", "Oral", 15.0)]
+    assert new_version == version + 1
+
+def test_failed_course_keeps_its_stored_grades(sync_db):
+    sync_db.sync_user_courses("alice", [course("1", "Anglais", ("Oral", 14.0)), course("2", "Web", ("TP", 12.0))])
+    # Matière 2 en échec : absente des données scrapées mais ni réécrite ni supprimée
+    sync_db.sync_user_courses("alice", [course("1", "Anglais", ("Oral", 14.0))], failed_ids=["2"])
+    assert stored(sync_db)[0] == [("1", "Oral", 14.0), ("2", "TP", 12.0)]
+
+def test_empty_scrape_never_wipes_stored_courses(sync_db):
+    sync_db.sync_user_courses("alice", [course("1", "Anglais", ("Oral", 14.0))])
+    sync_db.sync_user_courses("alice", [])
+    assert stored(sync_db)[0] == [("1", "Oral", 14.0)]
+
+def test_courses_are_scoped_per_user(sync_db):
+    sync_db.sync_user_courses("alice", [course("1", "Anglais", ("Oral", 14.0))])
+    sync_db.sync_user_courses("bob", [course("1", "Anglais", ("Oral", 9.0))])
+    assert stored(sync_db)[0] == [("1", "Oral", 14.0)]
+
+def moodle_scraper(handler):
+    s = scraper.AsyncMoodleScraper("alice", "secret", "42")
+    s.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=True)
+    s.is_connected = True
+    return s
+
+def test_error_pages_are_failures_not_empty_results():
+    def maintenance(request):
+        return httpx.Response(503, text="<html>Maintenance en cours</html>")
+    async def run():
+        s = moodle_scraper(maintenance)
+        try:
+            return await s.get_grades_for_course("7"), await s.get_all_courses()
+        finally:
+            await s.aclose()
+    assert asyncio.run(run()) == (None, None)
+
+def test_course_without_grades_is_an_empty_list():
+    def empty_report(request):
+        return httpx.Response(200, text="<table class='user-grade'></table>")
+    async def run():
+        s = moodle_scraper(empty_report)
+        try:
+            return await s.get_grades_for_course("7")
+        finally:
+            await s.aclose()
+    assert asyncio.run(run()) == []